@@ -1,41 +1,4058 @@
 import os
 import shutil
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk, simpledialog
 import threading
+import multiprocessing
+import atexit
+import queue
+import heapq
+import random
+import zlib
+import array
+import time
+import logging
+import logging.handlers
+import collections
+import itertools
+import importlib.util
 from pathlib import Path
-import google.generativeai as genai
-from docx import Document
-import PyPDF2
+import errno
+import sys
 import json
+import argparse
+import hmac
+import base64
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import hashlib
+import sqlite3
 import re
+import unicodedata
+import zipfile
+import struct
+import csv
+import mmap
+import codecs
+import tempfile
+import io
+from xml.etree import ElementTree
 from datetime import datetime
-from PIL import Image, ImageTk  # Para trabalhar com imagens/logos
 
-class FileOrganizer:
+try:
+    from PIL import Image, ImageOps  # Imagens enviadas à IA (sem Pillow, só nome/palavras-chave)
+except ImportError:
+    Image = ImageOps = None
+
+# Interface gráfica carregada só no modo gráfico (load_gui_modules): a linha
+# de comando roda em servidores sem tkinter
+tk = filedialog = messagebox = ttk = simpledialog = ImageTk = None
+
+
+def load_gui_modules():
+    """Importa tkinter e PIL.ImageTk (que depende do tkinter) para a interface"""
+    global tk, filedialog, messagebox, ttk, simpledialog, ImageTk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk, simpledialog
+    from PIL import ImageTk
+
+try:
+    import psutil  # Opcional: limite de memória dos processos de extração fora do Linux
+except ImportError:
+    psutil = None
+
+try:
+    import numpy as np  # Opcional: modelo local de pré-classificação
+except ImportError:
+    np = None
+
+try:
+    import xlrd  # Opcional: planilhas .xls (Excel 97-2003)
+except ImportError:
+    xlrd = None
+
+try:
+    import pypdfium2  # Opcional: backend de PDF (PDFium) e renderização de páginas
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import pymupdf as fitz  # Opcional: backend de PDF (PyMuPDF)
+except ImportError:
+    try:
+        import fitz  # Versões antigas do PyMuPDF
+    except ImportError:
+        fitz = None
+
+# =============== PIPELINE EM ESTÁGIOS ===============
+# Workers por estágio (descoberta → extração → classificação → nomeação → cópia).
+# A nomeação roda sempre em ordem de descoberta para manter os mesmos nomes
+# finais do modo sequencial.
+DEFAULT_STAGE_WORKERS = {
+    'extracao': os.cpu_count() or 4,
+    'classificacao': 8,
+    'copia': 4,
+}
+DEFAULT_QUEUE_SIZE = 64  # Tamanho máximo das filas entre estágios (backpressure)
+REORDER_WINDOW_QUEUES = 4  # Items em voo até o estágio ordenado, em múltiplos de queue_size
+
+_FIM = object()  # Sentinela de fim de fila
+
+SUPPORTED_EXTENSIONS = frozenset(['.pdf', '.docx', '.doc', '.txt', '.md', '.py', '.js', '.html',
+                                  '.css', '.json', '.xml', '.csv', '.xlsx', '.xls', '.jpg', '.png'])
+
+
+class FileJob:
+    """Registro compacto de um arquivo (caminho, tamanho, mtime) e do seu estado no pipeline"""
+    __slots__ = ('path', 'filename', 'size', 'mtime', 'content', 'image', 'result',
+                 'final_name', 'final_path', 'error', 'duplicate_of', 'seq')
+
+    def __init__(self, path, size=None, mtime=None):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.size = size
+        self.mtime = mtime
+        self.content = ""
+        self.image = None  # (JPEG reduzido, hash do JPEG) para classificação multimodal
+        self.result = None
+        self.final_name = None
+        self.final_path = None
+        self.error = None
+        self.duplicate_of = None
+        self.seq = None  # Posição na descoberta (numerada pelo DuplicateDetector)
+
+    @property
+    def active(self):
+        """Ainda deve passar pelos estágios (sem erro e não é duplicata)"""
+        return self.error is None and self.duplicate_of is None
+
+
+class PipelineStage:
+    """Estágio do pipeline: pool de workers consumindo uma fila limitada"""
+
+    def __init__(self, name, func, workers=1, ordered=False,
+                 batch_size=1, batch_cost=None, batch_budget=None, batch_linger=0.2):
+        self.name = name
+        self.func = func
+        # Estágios ordenados processam na ordem de entrada, logo um único worker
+        self.workers = 1 if ordered else max(1, int(workers))
+        self.ordered = ordered
+        # Estágios em lote recebem listas de items (até batch_size ou batch_budget)
+        self.batch_size = 1 if ordered else max(1, int(batch_size))
+        self.batch_cost = batch_cost or (lambda item: 0)
+        self.batch_budget = batch_budget
+        self.batch_linger = batch_linger
+
+
+class StagedPipeline:
+    """Pipeline de estágios concorrentes ligados por filas limitadas.
+    
+    Exceções que escapam de um estágio vão para errors e para
+    on_error(estágio, item, erro), com item None se a falha foi na descoberta;
+    o item segue adiante. O estágio ordenado guarda no máximo reorder_window
+    items esperando a vez: ao chegar nesse limite a descoberta para até ele
+    andar, mantendo o backpressure das filas. Se on_done falhar, a descoberta
+    para, os items em voo atravessam os estágios sem processamento, on_stop()
+    é chamado e a exceção sobe depois que todas as threads terminam.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, on_error=None, reorder_window=None, on_stop=None):
+        self.queue_size = max(1, int(queue_size))
+        self.stages = []
+        self.errors = []  # [(estágio, erro)]
+        self.on_error = on_error or (lambda stage, item, error: None)
+        self.on_stop = on_stop or (lambda: None)
+        self.stopping = threading.Event()
+        self.reorder_window = max(1, int(reorder_window or self.queue_size * REORDER_WINDOW_QUEUES))
+        self.window = None        # Vagas até o primeiro estágio ordenado (criadas em run)
+        self.window_stage = None
+
+    def add_stage(self, name, func, workers=1, ordered=False, **batching):
+        self.stages.append(PipelineStage(name, func, workers, ordered, **batching))
+        return self
+
+    def run(self, items, on_done):
+        """Alimenta o pipeline com items e chama on_done(item) na thread atual
+        para cada item que sai do último estágio"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.stopping = threading.Event()
+        self.window_stage = next((stage for stage in self.stages if stage.ordered), None)
+        if self.window_stage is not None:
+            self.window = threading.Semaphore(self.reorder_window)
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[index], queues[index + 1], remaining, lock, next_workers),
+                    daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        output = queues[-1]
+        try:
+            while True:
+                entry = output.get()
+                if entry is _FIM:
+                    break
+                on_done(entry[1])
+        except BaseException:
+            # Ex.: BrokenPipeError ao escrever a saída: sem esvaziar a última fila
+            # os estágios ficariam bloqueados para sempre
+            self.stop()
+            while output.get() is not _FIM:
+                pass
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        """Interrompe a execução: a descoberta para e os estágios só repassam os items"""
+        self.stopping.set()
+        self.on_stop()
+
+    def _feed(self, items, out_queue):
+        """Estágio de descoberta: numera os items e abastece a primeira fila"""
+        try:
+            for seq, item in enumerate(items):
+                if self.stopping.is_set():
+                    break
+                if self.window is not None:
+                    self.window.acquire()  # Devolvida quando o item sai do estágio ordenado
+                out_queue.put((seq, item))
+        except Exception as e:
+            self._fail('descoberta', None, e)
+        finally:
+            for _ in range(self.stages[0].workers if self.stages else 1):
+                out_queue.put(_FIM)
+
+    def _work(self, stage, in_queue, out_queue, remaining, lock, next_workers):
+        pending = []  # Buffer de reordenação (apenas estágios ordenados)
+        next_seq = 0
+        carry = None  # Item lido que não coube no lote anterior
+
+        while True:
+            entry = carry if carry is not None else in_queue.get()
+            carry = None
+            if entry is _FIM:
+                break
+
+            if stage.batch_size > 1:
+                batch, carry = self._collect_batch(stage, in_queue, entry)
+                for result in self._apply_batch(stage, batch):
+                    out_queue.put(result)
+                continue
+
+            if not stage.ordered:
+                out_queue.put(self._apply(stage, entry))
+                continue
+
+            heapq.heappush(pending, entry)
+            while pending and pending[0][0] == next_seq:
+                out_queue.put(self._apply(stage, heapq.heappop(pending)))
+                self._leave_window(stage)
+                next_seq += 1
+
+        # Esvazia o que restou no buffer (só acontece se a sequência tiver buracos)
+        while pending:
+            out_queue.put(self._apply(stage, heapq.heappop(pending)))
+            self._leave_window(stage)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                out_queue.put(_FIM)
+
+    def _leave_window(self, stage):
+        if stage is self.window_stage:
+            self.window.release()
+
+    def _collect_batch(self, stage, in_queue, first):
+        """Junta items até o tamanho/orçamento do lote ou até a fila ficar ociosa"""
+        batch = [first]
+        cost = stage.batch_cost(first[1])
+        while len(batch) < stage.batch_size:
+            try:
+                entry = in_queue.get(timeout=stage.batch_linger)
+            except queue.Empty:
+                break
+            if entry is _FIM:
+                return batch, entry
+            item_cost = stage.batch_cost(entry[1])
+            if stage.batch_budget is not None and cost + item_cost > stage.batch_budget:
+                return batch, entry
+            batch.append(entry)
+            cost += item_cost
+        return batch, None
+
+    def _apply_batch(self, stage, batch):
+        if self.stopping.is_set():
+            return batch
+        items = [item for _, item in batch]
+        try:
+            items = stage.func(items)
+        except Exception as e:
+            for item in items:
+                self._fail(stage.name, item, e)
+        return [(seq, item) for (seq, _), item in zip(batch, items)]
+
+    def _apply(self, stage, entry):
+        if self.stopping.is_set():
+            return entry
+        seq, item = entry
+        try:
+            item = stage.func(item)
+        except Exception as e:
+            self._fail(stage.name, item, e)
+        return seq, item
+
+    def _fail(self, stage_name, item, error):
+        self.errors.append((stage_name, error))
+        try:
+            self.on_error(stage_name, item, error)
+        except Exception:
+            pass  # Quem trata o erro não pode derrubar o worker
+
+
+# =============== DESCOBERTA DE ARQUIVOS ===============
+# 1 = varredura sequencial, na mesma ordem do os.walk. Com mais threads a ordem de
+# descoberta muda entre execuções e, com ela, os sufixos "(n)" e qual cópia de
+# cada grupo de duplicatas é a principal
+DEFAULT_SCAN_WORKERS = 1
+# Padrões no estilo .gitignore: "pasta/" só casa pastas, "a/b" é relativo à
+# origem, "**" atravessa pastas e "!padrão" reinclui o que foi excluído antes
+DEFAULT_EXCLUDE_PATTERNS = ['.git/', '.svn/', 'node_modules/', '__pycache__/', '.omnifile/',
+                            '~$*', '.~lock.*', '*.tmp', '*.temp', 'Thumbs.db', 'desktop.ini']
+
+
+def compile_pattern(pattern):
+    """Converte um padrão estilo .gitignore em (regex, negado, só pastas)"""
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and pattern.find(']', i + 2) != -1:
+            end = pattern.find(']', i + 2)
+            chars = pattern[i + 1:end].replace('\\', '\\\\')
+            regex += '[' + ('^' + chars[1:] if chars.startswith('!') else chars) + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    regex = ('^' if anchored else '(?:^|.*/)') + regex + '$'
+    return re.compile(regex, re.IGNORECASE), negate, dir_only
+
+
+class ScanFilter:
+    """Regras de inclusão/exclusão, extensões e limites de tamanho da varredura"""
+
+    def __init__(self, exclude=(), include=(), extensions=SUPPORTED_EXTENSIONS,
+                 min_size=0, max_size=None, skip_dirs=()):
+        self.exclude = [compile_pattern(p) for p in exclude if p.strip()]
+        self.include = [compile_pattern(p) for p in include if p.strip()]
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+        self.min_size = min_size or 0
+        self.max_size = max_size or None
+        self.skip_dirs = {os.path.normcase(os.path.abspath(path)) for path in skip_dirs}
+
+    def _excluded(self, rel_path, is_dir):
+        excluded = False
+        for regex, negate, dir_only in self.exclude:
+            if (is_dir or not dir_only) and regex.match(rel_path):
+                excluded = not negate
+        return excluded
+
+    def accept_dir(self, path, rel_path):
+        if os.path.normcase(os.path.abspath(path)) in self.skip_dirs:
+            return False
+        return not self._excluded(rel_path, True)
+
+    def accept_file(self, name, rel_path, size):
+        if os.path.splitext(name)[1].lower() not in self.extensions:
+            return False
+        if size < self.min_size or (self.max_size is not None and size > self.max_size):
+            return False
+        if self._excluded(rel_path, False):
+            return False
+        if self.include:
+            return any(regex.match(rel_path) for regex, _, dir_only in self.include if not dir_only)
+        return True
+
+
+class ParallelScanner:
+    """Varre a árvore de pastas com várias threads (uma pasta por vez em cada uma)
+    e entrega os arquivos aceitos como FileJob à medida que são encontrados.
+    
+    Com workers = 1 (o padrão) a varredura é sequencial e segue a ordem do
+    os.walk; com mais workers a ordem de descoberta varia entre execuções e os
+    resultados deixam de ser os mesmos da execução sequencial.
+    """
+
+    def __init__(self, root, scan_filter, workers=DEFAULT_SCAN_WORKERS, log=None):
+        self.root = root
+        self.filter = scan_filter
+        self.workers = max(1, int(workers))
+        self.log = log or (lambda message: None)
+
+    def __iter__(self):
+        if self.workers == 1:
+            return self._scan_sequential()
+        return self._scan_parallel()
+
+    def _scan_dir(self, path, rel_prefix, emit_file, emit_dir):
+        """Lê uma pasta: arquivos aceitos vão para emit_file, subpastas para emit_dir"""
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    rel_path = rel_prefix + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.filter.accept_dir(entry.path, rel_path):
+                                emit_dir((entry.path, rel_path + '/'))
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            if self.filter.accept_file(entry.name, rel_path, stat.st_size):
+                                emit_file(FileJob(entry.path, stat.st_size, stat.st_mtime_ns))
+                    except OSError:
+                        continue
+        except OSError as e:
+            self.log(f"⚠️ Sem acesso a {path}: {str(e)}")
+
+    def _scan_sequential(self):
+        stack = [(self.root, '')]
+        while stack:
+            path, rel_prefix = stack.pop()
+            files, subdirs = [], []
+            self._scan_dir(path, rel_prefix, files.append, subdirs.append)
+            yield from files
+            stack.extend(reversed(subdirs))
+
+    def _scan_parallel(self):
+        dirs = queue.Queue()
+        results = queue.Queue(maxsize=DEFAULT_QUEUE_SIZE * 16)
+        stop = threading.Event()
+        lock = threading.Lock()
+        pending = [1]  # Pastas enfileiradas ainda não lidas
+
+        def emit_dir(entry):
+            with lock:
+                pending[0] += 1
+            dirs.put(entry)
+
+        def emit_file(job):
+            while not stop.is_set():
+                try:
+                    results.put(job, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def worker():
+            while True:
+                entry = dirs.get()
+                if entry is _FIM:
+                    return
+                if not stop.is_set():
+                    self._scan_dir(entry[0], entry[1], emit_file, emit_dir)
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    for _ in range(self.workers):
+                        dirs.put(_FIM)
+                    results.put(_FIM)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        dirs.put((self.root, ''))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                job = results.get()
+                if job is _FIM:
+                    break
+                yield job
+        finally:
+            stop.set()  # Consumidor desistiu: libera as threads bloqueadas
+
+
+# =============== EXTRAÇÃO DE CONTEÚDO ===============
+# A extração roda em processos separados: um PDF patológico não trava o
+# restante e pode ser encerrado por timeout ou por excesso de memória
+DEFAULT_EXTRACTION_PROCESSES = os.cpu_count() or 4  # 0 = extrair na própria thread
+DEFAULT_EXTRACTION_TIMEOUT = 30.0      # Segundos por arquivo
+DEFAULT_EXTRACTION_MAX_MEMORY_MB = 1024
+TEXT_EXTENSIONS = ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.log']
+
+# Orçamento de caracteres por arquivo: o prompt usa só PROMPT_CONTENT_CHARS,
+# então a extração para assim que junta texto suficiente
+DEFAULT_CONTENT_BUDGET = 2000
+PDF_MAX_PAGES = 3
+DOCX_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCX_PARAGRAPH = DOCX_NAMESPACE + 'p'
+DOCX_TEXT = DOCX_NAMESPACE + 't'
+
+# Texto puro: nunca lê mais que o orçamento; arquivos grandes são amostrados
+# no início e no fim (logs costumam ter o mais relevante no final)
+TEXT_BYTES_PER_CHAR = 2              # Bytes lidos por caractere do orçamento
+TEXT_SAMPLE_MIN_SIZE = 1024 * 1024   # A partir daqui, amostra cabeça + cauda
+TEXT_TAIL_SHARE = 0.25               # Fração do orçamento dada à cauda
+TEXT_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# Imagens: reduzidas e recodificadas antes do envio (menos bytes e tokens)
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+DEFAULT_IMAGE_MAX_SIDE = 1024   # Pixels no maior lado
+DEFAULT_IMAGE_QUALITY = 80      # Qualidade JPEG
+SCAN_TEXT_MIN_CHARS = 20        # Menos texto que isso na 1ª página + imagens = PDF digitalizado
+
+CSV_SNIFF_BYTES = 4096
+CELL_SEPARATOR = " | "          # Separador de células ao achatar planilhas e CSV
+XLSX_SHARED_ESTIMATE = 8        # Caracteres estimados por string compartilhada ainda não lida
+
+# Arquivos OLE/CFB (.doc e .xls antigos)
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+OLE_END_OF_CHAIN = 0xFFFFFFFA   # Valores >= indicam fim de cadeia ou setor livre
+WORD_MAGIC = 0xA5EC
+WORD_97_NFIB = 0x00C0           # Versões anteriores (Word 6/95) têm outro FIB
+WORD_FIELD_CODE = re.compile('\x13[^\x13\x14\x15]*(?:\x14|(?=\x15))')  # Instrução de campo
+WORD_CONTROL_CHARS = str.maketrans({
+    '\r': '\n', '\x0b': '\n', '\x0c': '\n', '\x07': '\t', '\xa0': ' ', '\x1e': '-',
+    '\x01': None, '\x08': None, '\x13': None, '\x14': None, '\x15': None, '\x1f': None,
+})
+
+
+class ExtractionError(Exception):
+    """Falha de extração estruturada; kind é 'timeout', 'memoria' ou 'falha'"""
+
+    def __init__(self, kind, detail=""):
+        super().__init__(f"{kind}: {detail}" if detail else kind)
+        self.kind = kind
+        self.detail = detail
+
+
+class PdfBackend:
+    """Backend de extração de PDF: abre o arquivo e expõe texto e imagens por página.
+    
+    Subclasses registradas em PDF_BACKENDS; available indica se a biblioteca
+    está instalada. PyPDF2 serve de fallback quando instalado.
+    """
+    name = None
+    available = False
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def page_count(self):
+        raise NotImplementedError
+
+    def page_text(self, index):
+        raise NotImplementedError
+
+    def probe_text(self, index):
+        """Texto da página para a sonda de PDF digitalizado (pode ser mais barato que page_text)"""
+        return self.page_text(index)
+
+    def page_has_images(self, index):
+        raise NotImplementedError
+
+    def render_page(self, index, max_side):
+        """Imagem PIL da página com o maior lado perto de max_side"""
+        raise NotImplementedError
+
+
+class PyPDF2Backend(PdfBackend):
+    name = 'pypdf2'
+    available = importlib.util.find_spec('PyPDF2') is not None
+
+    def __init__(self, file_path):
+        import PyPDF2  # Só ao abrir um PDF: importar o script (e cada processo de extração) fica mais leve
+        super().__init__(file_path)
+        self.file = open(file_path, 'rb')
+        self.reader = PyPDF2.PdfReader(self.file, strict=False)  # Páginas lidas sob demanda
+
+    def close(self):
+        self.file.close()
+
+    def page_count(self):
+        return len(self.reader.pages)
+
+    def page_text(self, index):
+        return self.reader.pages[index].extract_text() or ""
+
+    def probe_text(self, index):
+        # Sem fontes não há texto a extrair
+        return self.page_text(index) if self._resource(index, '/Font') else ""
+
+    def _resource(self, index, name):
+        resources = self.reader.pages[index].get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        entry = resources.get(name)
+        return entry.get_object() if entry is not None else {}
+
+    def page_has_images(self, index):
+        xobjects = self._resource(index, '/XObject')
+        return any(xobjects[name].get_object().get('/Subtype') == '/Image' for name in xobjects)
+
+    def render_page(self, index, max_side):
+        if PdfiumBackend.available:
+            with PdfiumBackend(self.file_path) as backend:
+                return backend.render_page(index, max_side)
+        # Sem renderizador: a maior imagem da página (o scan, em PDFs digitalizados)
+        images = self.reader.pages[index].images
+        if not images:
+            raise ValueError("página sem imagens legíveis")
+        largest = max(images, key=lambda image: len(image.data))
+        image = Image.open(io.BytesIO(largest.data))
+        image.draft('RGB', (max_side, max_side))
+        return image
+
+
+class PdfiumBackend(PdfBackend):
+    name = 'pypdfium2'
+    available = pypdfium2 is not None
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.document = pypdfium2.PdfDocument(file_path)
+
+    def close(self):
+        self.document.close()
+
+    def page_count(self):
+        return len(self.document)
+
+    def page_text(self, index):
+        textpage = self.document[index].get_textpage()
+        try:
+            return textpage.get_text_range().replace('\r\n', '\n')
+        finally:
+            textpage.close()
+
+    def page_has_images(self, index):
+        objects = self.document[index].get_objects(filter=[pypdfium2.raw.FPDF_PAGEOBJ_IMAGE])
+        return next(objects, None) is not None
+
+    def render_page(self, index, max_side):
+        page = self.document[index]
+        scale = max_side / max(page.get_size())  # Renderiza já no tamanho de envio
+        return page.render(scale=scale).to_pil()
+
+
+class PyMuPDFBackend(PdfBackend):
+    name = 'pymupdf'
+    available = fitz is not None
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.document = fitz.open(file_path)
+
+    def close(self):
+        self.document.close()
+
+    def page_count(self):
+        return self.document.page_count
+
+    def page_text(self, index):
+        return self.document[index].get_text()
+
+    def page_has_images(self, index):
+        return bool(self.document[index].get_images())
+
+    def render_page(self, index, max_side):
+        page = self.document[index]
+        scale = max_side / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+PDF_BACKENDS = {backend.name: backend for backend in (PyMuPDFBackend, PdfiumBackend, PyPDF2Backend)}
+DEFAULT_PDF_BACKEND = 'auto'  # 'auto' = o mais rápido no micro-benchmark
+
+
+def available_pdf_backends():
+    return [name for name, backend in PDF_BACKENDS.items() if backend.available]
+
+
+def _sample_pdf(path, pages=PDF_MAX_PAGES, lines=40):
+    """Grava um PDF de texto simples para o micro-benchmark (sem depender de arquivos do usuário)"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                   " ".join(f"{3 + 2 * i} 0 R" for i in range(pages)), pages)]
+    for page in range(pages):
+        body = " ".join(f"0 -14 Td (Linha {line} da pagina {page}: relatorio de analise do contrato) Tj"
+                        for line in range(lines))
+        stream = f"BT /F1 11 Tf 50 780 Td {body} ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + 2 * page} 0 R "
+                       f"/Resources << /Font << /F1 {3 + 2 * pages} 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data, offsets = "%PDF-1.4\n", []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, 'w', encoding='latin-1') as file:
+        file.write(data)
+
+
+def benchmark_pdf_backends(sample_path=None, repeats=5):
+    """Tempo médio (ms) de cada backend disponível extraindo o texto de um PDF de
+    amostra; None para os que falharam (ficam registrados, mas fora da escolha)"""
+    with tempfile.TemporaryDirectory() as folder:
+        if sample_path is None:
+            sample_path = os.path.join(folder, "amostra.pdf")
+            _sample_pdf(sample_path)
+        timings = {}
+        for name in available_pdf_backends():
+            try:
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    with PDF_BACKENDS[name](sample_path) as backend:
+                        _pdf_text(backend, DEFAULT_CONTENT_BUDGET * 10)
+                timings[name] = round((time.perf_counter() - start) * 1000 / repeats, 2)
+            except Exception:
+                timings[name] = None  # Backend instalado mas quebrado
+    return timings
+
+
+def _pdf_text(backend, budget, first_page_text=None):
+    """Texto das primeiras páginas, parando assim que o orçamento é atingido"""
+    parts, collected = [], 0
+    for index in range(min(PDF_MAX_PAGES, backend.page_count())):
+        if index == 0 and first_page_text is not None:
+            page_text = first_page_text  # Já extraído pela sonda de PDF digitalizado
+        else:
+            page_text = backend.page_text(index)
+        parts.append(page_text)
+        collected += len(page_text)
+        if collected >= budget:
+            break
+    return "\n".join(parts)[:budget]
+
+
+def _pdf_backend(pdf_backend):
+    backend = PDF_BACKENDS.get(pdf_backend)
+    if backend is not None and backend.available:
+        return backend
+    if PyPDF2Backend.available:
+        return PyPDF2Backend
+    # Sem PyPDF2, qualquer backend instalado (sem nenhum, a abertura acusa a falta do PyPDF2)
+    return next((backend for backend in PDF_BACKENDS.values() if backend.available), PyPDF2Backend)
+
+
+def _extract_pdf(file_path, budget, pdf_backend=PyPDF2Backend.name, **options):
+    with _pdf_backend(pdf_backend)(file_path) as backend:
+        return _pdf_text(backend, budget)
+
+
+def _extract_docx(file_path, budget, **options):
+    """Parágrafos do DOCX lidos em streaming do word/document.xml, sem montar o documento"""
+    parts, collected = [], 0
+    with zipfile.ZipFile(file_path) as package, package.open('word/document.xml') as xml:
+        for _, elem in ElementTree.iterparse(xml, events=('end',)):
+            if elem.tag != DOCX_PARAGRAPH:
+                continue
+            text = "".join(node.text or "" for node in elem.iter(DOCX_TEXT))
+            elem.clear()  # Libera o parágrafo já lido
+            if text.strip():
+                parts.append(text)
+                collected += len(text) + 1
+                if collected >= budget:
+                    break
+    return "\n".join(parts)[:budget]
+
+
+def sniff_encoding(sample):
+    """(codec, tamanho do BOM) da amostra: BOM, UTF-8 válido, senão CP1252 ou Latin-1"""
+    for bom, codec in TEXT_BOMS:
+        if sample.startswith(bom):
+            return codec, len(bom)
+    try:
+        # final=False: a amostra pode terminar no meio de um caractere
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1252')
+        return 'cp1252', 0
+    except UnicodeDecodeError:
+        return 'latin-1', 0
+
+
+def _decode(data, codec):
+    return codecs.getincrementaldecoder(codec)(errors='ignore').decode(data, final=False)
+
+
+def _extract_plain(file_path, budget, sample_tail=True, **options):
+    """Leitura limitada ao orçamento; arquivos grandes levam também o final (via mmap)"""
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not sample_tail or size < TEXT_SAMPLE_MIN_SIZE:
+            head = file.read(budget * TEXT_BYTES_PER_CHAR)
+            codec, bom = sniff_encoding(head)
+            return _decode(head[bom:], codec)[:budget]
+
+        tail_chars = int(budget * TEXT_TAIL_SHARE)
+        head_chars = budget - tail_chars
+        tail_bytes = tail_chars * TEXT_BYTES_PER_CHAR  # Par: mantém o alinhamento do UTF-16
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            head = mapped[:head_chars * TEXT_BYTES_PER_CHAR]
+            tail = mapped[size - tail_bytes:]
+
+    codec, bom = sniff_encoding(head)
+    tail_text = _decode(tail, codec)
+    if '\n' in tail_text:
+        tail_text = tail_text.split('\n', 1)[1]  # Começa numa linha inteira
+    return _decode(head[bom:], codec)[:head_chars] + "\n[...]\n" + tail_text[-tail_chars:]
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _extract_xml(file_path, budget, **options):
+    """Texto dos elementos de um XML lido em streaming"""
+    parts, collected = [], 0
+    try:
+        for _, elem in ElementTree.iterparse(file_path, events=('end',)):
+            text = (elem.text or "").strip()
+            elem.clear()
+            if text:
+                parts.append(text)
+                collected += len(text) + 1
+                if collected >= budget:
+                    break
+    except ElementTree.ParseError:
+        if not parts:
+            raise  # XML truncado ainda aproveita o que foi lido
+    return "\n".join(parts)[:budget]
+
+
+def _extract_csv(file_path, budget, **options):
+    """Linhas do CSV (delimitador e codificação detectados) até o orçamento"""
+    with open(file_path, 'rb') as file:
+        head = file.read(CSV_SNIFF_BYTES)
+    codec, bom = sniff_encoding(head)
+    sample = _decode(head[bom:], codec)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = 'excel-tab' if '\t' in sample else 'excel'
+
+    parts, collected = [], 0
+    with open(file_path, 'r', encoding=codec, errors='replace', newline='') as file:
+        if bom:
+            file.read(1)
+        for row in csv.reader(file, dialect):
+            line = CELL_SEPARATOR.join(cell.strip() for cell in row if cell.strip())
+            if line:
+                parts.append(line)
+                collected += len(line) + 1
+                if collected >= budget:
+                    break
+    return "\n".join(parts)[:budget]
+
+
+def _xlsx_first_sheet(package):
+    """(nomes das planilhas, caminho da primeira planilha) pelo workbook.xml e seus rels"""
+    workbook = ElementTree.fromstring(package.read('xl/workbook.xml'))
+    sheets = [elem for elem in workbook.iter() if _local_name(elem.tag) == 'sheet']
+    names = [sheet.get('name', '') for sheet in sheets]
+    target = None
+    if sheets and 'xl/_rels/workbook.xml.rels' in package.namelist():
+        rel_id = next((value for key, value in sheets[0].attrib.items() if _local_name(key) == 'id'), None)
+        rels = ElementTree.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels:
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target', '')
+                target = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    if target not in package.namelist():
+        worksheets = sorted(name for name in package.namelist() if name.startswith('xl/worksheets/sheet'))
+        target = worksheets[0] if worksheets else None
+    return names, target
+
+
+def _extract_xlsx(file_path, budget, **options):
+    """Primeiras linhas da primeira planilha, em streaming; só as strings compartilhadas usadas são lidas"""
+    with zipfile.ZipFile(file_path) as package:
+        names, sheet_path = _xlsx_first_sheet(package)
+        if not sheet_path:
+            return ""
+
+        # Células: str (valor direto) ou int (índice em sharedStrings.xml)
+        rows, row, estimate = [], [], 0
+        with package.open(sheet_path) as xml:
+            for _, elem in ElementTree.iterparse(xml, events=('end',)):
+                tag = _local_name(elem.tag)
+                if tag == 'c':
+                    kind = elem.get('t')
+                    if kind == 'inlineStr':
+                        value = "".join(node.text or "" for node in elem.iter() if _local_name(node.tag) == 't')
+                    else:
+                        value = next((node.text for node in elem if _local_name(node.tag) == 'v'), None)
+                    if value:
+                        if kind == 's':
+                            row.append(int(value))
+                            estimate += XLSX_SHARED_ESTIMATE
+                        else:
+                            row.append(value)
+                            estimate += len(value) + len(CELL_SEPARATOR)
+                    elem.clear()
+                elif tag == 'row':
+                    if row:
+                        rows.append(row)
+                        row = []
+                    elem.clear()
+                    if estimate >= budget:
+                        break
+        if row:
+            rows.append(row)
+
+        needed = {cell for cells in rows for cell in cells if isinstance(cell, int)}
+        shared = {}
+        if needed and 'xl/sharedStrings.xml' in package.namelist():
+            last, index = max(needed), 0
+            with package.open('xl/sharedStrings.xml') as xml:
+                for _, elem in ElementTree.iterparse(xml, events=('end',)):
+                    if _local_name(elem.tag) != 'si':
+                        continue
+                    if index in needed:
+                        shared[index] = "".join(node.text or "" for node in elem.iter()
+                                                if _local_name(node.tag) == 't')
+                    elem.clear()
+                    index += 1
+                    if index > last:
+                        break
+
+    lines = [f"Planilhas: {', '.join(names)}"] if names else []
+    for cells in rows:
+        values = [shared.get(cell, "") if isinstance(cell, int) else cell for cell in cells]
+        lines.append(CELL_SEPARATOR.join(value.strip() for value in values if value.strip()))
+    return "\n".join(line for line in lines if line)[:budget]
+
+
+def _extract_xls(file_path, budget, **options):
+    """Primeiras linhas da primeira planilha .xls (requer xlrd)"""
+    book = xlrd.open_workbook(file_path, on_demand=True)  # Carrega cada planilha só quando pedida
+    try:
+        lines, collected = [f"Planilhas: {', '.join(book.sheet_names())}"], 0
+        sheet = book.sheet_by_index(0)
+        for index in range(sheet.nrows):
+            values = (str(int(value) if isinstance(value, float) and value.is_integer() else value).strip()
+                      for value in sheet.row_values(index))
+            line = CELL_SEPARATOR.join(value for value in values if value)
+            if line:
+                lines.append(line)
+                collected += len(line) + 1
+                if collected >= budget:
+                    break
+        return "\n".join(lines)[:budget]
+    finally:
+        book.release_resources()
+
+
+class OleReader:
+    """Leitor mínimo de arquivos OLE/CFB: lê trechos de streams sem carregar o arquivo"""
+
+    def __init__(self, file):
+        self.file = file
+        header = file.read(512)
+        if len(header) < 512 or header[:8] != OLE_SIGNATURE:
+            raise ValueError("não é um arquivo OLE")
+        self.sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from('<H', header, 0x20)[0]
+        (fat_count, dir_start, _, self.mini_cutoff, minifat_start, _,
+         difat_start, difat_count) = struct.unpack_from('<8I', header, 0x2C)
+
+        # Setores da FAT: 109 no cabeçalho, o resto encadeado em setores DIFAT
+        per_sector = self.sector_size // 4
+        difat = list(struct.unpack_from('<109I', header, 0x4C))
+        sector = difat_start
+        for _ in range(difat_count):
+            if sector >= OLE_END_OF_CHAIN:
+                break
+            entries = struct.unpack(f'<{per_sector}I', self._read_sector(sector))
+            difat.extend(entries[:-1])
+            sector = entries[-1]
+        self.fat = []
+        for sector in difat[:fat_count]:
+            if sector < OLE_END_OF_CHAIN:
+                self.fat.extend(struct.unpack(f'<{per_sector}I', self._read_sector(sector)))
+
+        self.streams = {}
+        directory = b"".join(self._read_sector(s) for s in self._chain(self.fat, dir_start))
+        for offset in range(0, len(directory) - 127, 128):
+            name_size, kind = struct.unpack_from('<HB', directory, offset + 0x40)
+            start, size = struct.unpack_from('<II', directory, offset + 0x74)
+            name = directory[offset:offset + max(0, name_size - 2)].decode('utf-16-le', errors='ignore')
+            if kind == 5:  # Raiz: guarda o mini stream
+                self.root = (start, size)
+            elif kind == 2:
+                self.streams.setdefault(name, (start, size))
+
+        self.minifat = []
+        if minifat_start < OLE_END_OF_CHAIN:
+            for sector in self._chain(self.fat, minifat_start):
+                self.minifat.extend(struct.unpack(f'<{per_sector}I', self._read_sector(sector)))
+        self._root_chain = self._chain(self.fat, self.root[0]) if self.minifat else []
+        self._chains = {}
+
+    def _read_sector(self, sector):
+        self.file.seek((sector + 1) * self.sector_size)
+        return self.file.read(self.sector_size)
+
+    def _read_mini_sector(self, sector):
+        return self._read_range(self._root_chain, self.sector_size, self._read_sector,
+                                sector * self.mini_sector_size, self.mini_sector_size)
+
+    def _chain(self, table, start):
+        chain = []
+        while start < OLE_END_OF_CHAIN:
+            if start >= len(table) or len(chain) > len(table):
+                raise ValueError("cadeia de setores corrompida")
+            chain.append(start)
+            start = table[start]
+        return chain
+
+    def _read_range(self, chain, unit, read_unit, offset, length):
+        data = bytearray()
+        while len(data) < length:
+            index, skip = divmod(offset + len(data), unit)
+            if index >= len(chain):
+                break
+            data += read_unit(chain[index])[skip:skip + length - len(data)]
+        return bytes(data)
+
+    def read(self, name, offset=0, length=None):
+        """Até length bytes do stream a partir de offset"""
+        if name not in self.streams:
+            raise ValueError(f"stream '{name}' ausente")
+        start, size = self.streams[name]
+        length = max(0, min(size - offset, size if length is None else length))
+        if size < self.mini_cutoff:
+            table, unit, read_unit = self.minifat, self.mini_sector_size, self._read_mini_sector
+        else:
+            table, unit, read_unit = self.fat, self.sector_size, self._read_sector
+        if name not in self._chains:
+            self._chains[name] = self._chain(table, start)
+        return self._read_range(self._chains[name], unit, read_unit, offset, length)
+
+
+def _extract_doc(file_path, budget, **options):
+    """Texto do .doc (Word 97-2003) pela tabela de peças, lendo só os trechos necessários"""
+    with open(file_path, 'rb') as file:
+        ole = OleReader(file)
+        fib = ole.read('WordDocument', 0, 0x1AA)
+        if len(fib) < 0x1AA or struct.unpack_from('<H', fib, 0)[0] != WORD_MAGIC:
+            raise ValueError("não é um documento do Word")
+        n_fib = struct.unpack_from('<H', fib, 0x02)[0]
+        flags = struct.unpack_from('<H', fib, 0x0A)[0]
+        if n_fib < WORD_97_NFIB:
+            raise ValueError("versão do Word anterior ao 97 não suportada")
+        if flags & 0x0100:
+            raise ValueError("documento criptografado")
+        table = '1Table' if flags & 0x0200 else '0Table'
+        text_chars = struct.unpack_from('<I', fib, 0x4C)[0]  # Só o corpo, sem notas e cabeçalhos
+        clx_offset, clx_size = struct.unpack_from('<II', fib, 0x1A2)
+        clx = ole.read(table, clx_offset, clx_size)
+
+        # Clx: blocos Prc (0x01) de formatação e depois a tabela de peças (0x02)
+        pos = 0
+        while pos < len(clx) and clx[pos] == 0x01:
+            pos += 3 + struct.unpack_from('<h', clx, pos + 1)[0]
+        if pos + 5 > len(clx) or clx[pos] != 0x02:
+            raise ValueError("tabela de peças não encontrada")
+        plc_size = struct.unpack_from('<I', clx, pos + 1)[0]
+        plc = clx[pos + 5:pos + 5 + plc_size]
+        count = (plc_size - 4) // 12
+        cps = struct.unpack_from(f'<{count + 1}I', plc, 0)
+
+        # Lê o dobro do orçamento: instruções de campo somem na limpeza
+        parts, wanted = [], budget * 2
+        for index in range(count):
+            start, end = cps[index], min(cps[index + 1], text_chars)
+            if start >= end or wanted <= 0:
+                break
+            chars = min(end - start, wanted)
+            fc = struct.unpack_from('<I', plc, 4 * (count + 1) + 8 * index + 2)[0]
+            if fc & 0x40000000:  # Peça comprimida: 1 byte por caractere (CP1252)
+                raw = ole.read('WordDocument', (fc & 0x3FFFFFFF) // 2, chars)
+                text = raw.decode('cp1252', errors='replace')
+            else:
+                text = ole.read('WordDocument', fc, chars * 2).decode('utf-16-le', errors='ignore')
+            parts.append(text)
+            wanted -= len(text)
+
+    text = "".join(parts)
+    while True:
+        stripped = WORD_FIELD_CODE.sub('', text)
+        if stripped == text:
+            break
+        text = stripped
+    return text.translate(WORD_CONTROL_CHARS)[:budget]
+
+
+# Extrator por extensão; extensões ausentes não têm conteúdo extraível
+EXTRACTORS = {
+    '.pdf': _extract_pdf,
+    '.docx': _extract_docx,
+    '.doc': _extract_doc,
+    '.xml': _extract_xml,
+    '.csv': _extract_csv,
+    '.xlsx': _extract_xlsx,
+    **{ext: _extract_plain for ext in TEXT_EXTENSIONS},
+}
+if xlrd is not None:
+    EXTRACTORS['.xls'] = _extract_xls
+
+
+def extract_text(file_path, budget=DEFAULT_CONTENT_BUDGET, **options):
+    """Extrai até budget caracteres do arquivo; erros são propagados para quem chamou"""
+    extractor = EXTRACTORS.get(Path(file_path).suffix.lower())
+    return extractor(file_path, budget, **options) if extractor else ""
+
+
+def downscale_image(image, max_side=DEFAULT_IMAGE_MAX_SIDE, quality=DEFAULT_IMAGE_QUALITY):
+    """(JPEG reduzido, hash do JPEG) de uma imagem PIL já aberta.
+    
+    O hash é exato: um hash perceptual junta digitalizações diferentes com o
+    mesmo layout (e toda imagem lisa), que herdariam a categoria e o nome de outra.
+    """
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        background = Image.new('RGB', image.size, 'white')  # Transparência vira fundo branco
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA'))
+        image = background
+    else:
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True)
+    data = buffer.getvalue()
+    return data, hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def prepare_image(file_path, max_side=DEFAULT_IMAGE_MAX_SIDE, quality=DEFAULT_IMAGE_QUALITY):
+    with Image.open(file_path) as image:
+        image.draft('RGB', (max_side, max_side))  # JPEG: decodifica já reduzido
+        return downscale_image(ImageOps.exif_transpose(image), max_side, quality)
+
+
+def _extract_pdf_document(file_path, budget=DEFAULT_CONTENT_BUDGET, image_max_side=DEFAULT_IMAGE_MAX_SIDE,
+                          image_quality=DEFAULT_IMAGE_QUALITY, pdf_backend=PyPDF2Backend.name, **options):
+    """Sonda a 1ª página: sem camada de texto e com imagens, vai direto para a imagem"""
+    with _pdf_backend(pdf_backend)(file_path) as backend:
+        if not backend.page_count():
+            return "", None
+        first_text = backend.probe_text(0)
+        if (len(first_text.strip()) < SCAN_TEXT_MIN_CHARS and Image is not None
+                and backend.page_has_images(0)):
+            page = backend.render_page(0, image_max_side)
+            return "", downscale_image(page, image_max_side, image_quality)
+        return _pdf_text(backend, budget, first_text), None
+
+
+def extract_document(file_path, image_max_side=DEFAULT_IMAGE_MAX_SIDE,
+                     image_quality=DEFAULT_IMAGE_QUALITY, **options):
+    """(texto, imagem) do arquivo; imagem é (JPEG reduzido, hash) ou None"""
+    ext = Path(file_path).suffix.lower()
+    if ext in IMAGE_EXTENSIONS:
+        if Image is None:
+            return "", None  # Sem Pillow: classificada pelo nome do arquivo
+        return "", prepare_image(file_path, image_max_side, image_quality)
+    if ext == '.pdf':
+        return _extract_pdf_document(file_path, image_max_side=image_max_side,
+                                     image_quality=image_quality, **options)
+    return extract_text(file_path, **options), None
+
+
+def _limit_memory(max_memory_mb):
+    """Limita o espaço de endereçamento do processo (Linux) a max_memory_mb além do já usado"""
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            in_use = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+        limit = in_use + max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, OSError, ValueError):
+        pass
+
+
+def _extraction_worker(conn, max_memory_mb, options):
+    """Laço do processo de extração: recebe caminhos e devolve (status, texto/erro)"""
+    _limit_memory(max_memory_mb)
+    while True:
+        try:
+            path = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send(('ok', extract_document(path, **options)))
+        except MemoryError:
+            conn.send(('memoria', "limite de memória excedido"))
+            return
+        except Exception as e:
+            conn.send(('falha', f"{type(e).__name__}: {str(e)}"))
+
+
+class _ExtractionProcess:
+    """Um processo de extração e o seu canal de comunicação"""
+
+    def __init__(self, context, max_memory_mb, options):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_extraction_worker,
+                                       args=(child_conn, max_memory_mb, options), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def rss_mb(self):
+        if psutil is None:
+            return None
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            return None
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+
+class ExtractionPool:
+    """Pool de processos de extração com timeout e teto de memória por arquivo.
+    
+    Cada chamada usa um processo ocioso; se ele estourar o tempo ou a memória,
+    é encerrado e outro nasce no lugar na próxima chamada.
+    """
+
+    def __init__(self, processes=DEFAULT_EXTRACTION_PROCESSES, timeout=DEFAULT_EXTRACTION_TIMEOUT,
+                 max_memory_mb=DEFAULT_EXTRACTION_MAX_MEMORY_MB, options=None):
+        # 'spawn' em todas as plataformas: fork com threads (Tk, gRPC) não é seguro
+        self.context = multiprocessing.get_context('spawn')
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.options = options or {}  # Repassadas a extract_document
+        self.idle = queue.Queue()
+        self.workers = set()
+        self.lock = threading.Lock()
+        for _ in range(max(1, processes)):
+            self.idle.put(None)  # Processo criado no primeiro uso
+        atexit.register(self.close)
+
+    def extract(self, path):
+        """(texto, imagem) do arquivo; ExtractionError em timeout, memória ou falha"""
+        worker = self.idle.get()
+        try:
+            if worker is None or not worker.process.is_alive():
+                worker = self._spawn(worker)
+            worker.conn.send(path)
+
+            deadline = time.monotonic() + self.timeout
+            while not worker.conn.poll(min(max(deadline - time.monotonic(), 0), 0.5)):
+                if time.monotonic() >= deadline:
+                    worker = self._discard(worker)
+                    raise ExtractionError('timeout', f"mais de {self.timeout:.0f}s")
+                rss = worker.rss_mb()
+                if rss is not None and rss > self.max_memory_mb:
+                    worker = self._discard(worker)
+                    raise ExtractionError('memoria', f"{rss:.0f} MB")
+
+            status, payload = worker.conn.recv()
+            if status == 'ok':
+                return payload
+            if status == 'memoria':
+                worker = self._discard(worker)
+            raise ExtractionError(status, payload)
+        except (EOFError, OSError) as e:
+            worker = self._discard(worker)
+            raise ExtractionError('falha', f"processo de extração encerrado ({str(e)})")
+        finally:
+            self.idle.put(worker)
+
+    def _spawn(self, old_worker):
+        if old_worker is not None:
+            self._discard(old_worker)
+        worker = _ExtractionProcess(self.context, self.max_memory_mb, self.options)
+        with self.lock:
+            self.workers.add(worker)
+        return worker
+
+    def _discard(self, worker):
+        if worker is not None:
+            with self.lock:
+                self.workers.discard(worker)
+            worker.kill()
+        return None
+
+    def close(self):
+        with self.lock:
+            workers, self.workers = self.workers, set()
+        for worker in workers:
+            worker.kill()
+
+
+# =============== PROMPT DE CLASSIFICAÇÃO ===============
+CATEGORIES = [
+    "Oficios_e_Pareceres",
+    "Relatorios_e_Analises",
+    "Processos_Judiciais",
+    "Ouvidoria_e_Reclamacoes",
+    "Contratos_e_Acordos",
+    "Leis_e_Normativas",
+    "Deliberacoes_e_Resolucoes",
+    "Documentos_Pessoais",
+    "Financeiro_e_Pagamentos",
+    "Correspondencias_Gerais",
+    "Outros_Documentos",
+]
+
+CATEGORY_LIST = "CATEGORIAS DISPONÍVEIS:\n" + "\n".join(f"- {category}" for category in CATEGORIES)
+
+CLASSIFICATION_RULES = """REGRAS DE CATEGORIZAÇÃO:
+- Ofício, parecer, memo, circular, comunicado = "Oficios_e_Pareceres"
+- E-proc, processo, sentença, decisão, acórdão, despacho = "Processos_Judiciais"
+- Ouvidoria, reclamação, denúncia, manifestação = "Ouvidoria_e_Reclamacoes"
+- Relatório, análise, levantamento, estudo = "Relatorios_e_Analises"
+- Contrato, convênio, acordo, termo = "Contratos_e_Acordos"
+- Lei, decreto, portaria, resolução normativa = "Leis_e_Normativas"
+- Deliberação, ata, resolução administrativa = "Deliberacoes_e_Resolucoes"
+- CPF, RG, certidão, comprovante residência = "Documentos_Pessoais"
+- Fatura, nota fiscal, comprovante pagamento = "Financeiro_e_Pagamentos"
+- E-mail, carta, notificação = "Correspondencias_Gerais"
+
+REGRAS PARA NOME:
+- SEMPRE incluir o ASSUNTO PRINCIPAL do documento
+- Se mencionar NOME DE PESSOA, incluir no título
+- Se mencionar EMPRESA/ÓRGÃO, incluir no título
+- NUNCA usar apenas datas (ex: "2024-01-15")
+- NUNCA usar nomes genéricos (ex: "Documento", "Arquivo")
+- Ser ESPECÍFICO sobre o conteúdo (ex: "Contrato Fornecimento João Silva", "Relatório Vendas Janeiro 2024")
+- Máximo 70 caracteres"""
+
+PROMPT_CONTENT_CHARS = 2000  # Caracteres do conteúdo enviados por documento
+
+# Versão do prompt: muda sozinha quando as categorias ou as regras mudam,
+# invalidando o cache de classificações
+PROMPT_VERSION = hashlib.sha256(
+    f"{CATEGORY_LIST}|{CLASSIFICATION_RULES}|{PROMPT_CONTENT_CHARS}".encode('utf-8')).hexdigest()[:16]
+
+# Lotes: vários documentos por requisição (batch_size = 1 desativa)
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_TOKEN_BUDGET = 8000
+BATCH_DOC_PATTERN = re.compile(r'^\s*[=#*\s]*DOC(?:UMENTO)?\s*:?\s*(\d+)', re.IGNORECASE)
+# "CATEGORIA: X", também com marcação ("**CATEGORIA:** X", "- NOME: [Y]")
+ANSWER_FIELD_PATTERN = re.compile(r'^[\s*#>`-]*(CATEGORIA|NOME)[\s*`]*:[\s*`\[]*(.*?)[\s*`\]]*$', re.IGNORECASE)
+
+IMAGE_TOKENS = 258  # Custo fixo do Gemini por imagem anexada
+
+
+# =============== CLASSIFICAÇÃO LOCAL POR PALAVRAS-CHAVE ===============
+# Palavras sem acento; "*" marca prefixo (oficio* casa com oficios), sem "*" só a palavra inteira.
+# Em empate de pontuação vence a regra que aparece primeiro.
+KEYWORD_RULES = (
+    ("Oficios_e_Pareceres", "oficio* parecer* requer* solicit* memo* circular*"),
+    ("Processos_Judiciais", "eproc* e-proc* processo* sentenc* decisao decisoes judicia* acordao* despacho*"),
+    ("Ouvidoria_e_Reclamacoes", "ouvidoria* reclamac* denuncia* manifestac*"),
+    ("Relatorios_e_Analises", "relatorio* analise* levantamento* estudo*"),
+    ("Contratos_e_Acordos", "contrato* acordo* convenio* termo*"),
+    ("Leis_e_Normativas", "lei leis decreto* portaria* norma normas normativ* resoluc*"),
+    ("Deliberacoes_e_Resolucoes", "deliberac* ata atas resoluc*"),
+    ("Documentos_Pessoais", "cpf rg certidao certidoes identidade* comprovante*"),
+    ("Financeiro_e_Pagamentos", "fatura* nota notas pagamento* financeir* orcamento*"),
+    ("Correspondencias_Gerais", "email* e-mail* carta cartas notificac* comunicac*"),
+)
+KEYWORD_FILENAME_WEIGHT = 3  # Uma palavra no nome do arquivo vale mais que uma no conteúdo
+
+
+def _keyword_alternation(words):
+    return "|".join(re.escape(word[:-1]) if word.endswith('*') else re.escape(word) + r'\b'
+                    for word in words.split())
+
+
+# Uma única expressão com um grupo nomeado por categoria: uma passada classifica o texto todo
+KEYWORD_PATTERN = re.compile(r'\b(?:' + "|".join(
+    f"(?P<c{index}>{_keyword_alternation(words)})" for index, (_, words) in enumerate(KEYWORD_RULES)) + ")")
+
+
+def fold_text(text):
+    """Minúsculas sem acentos ("Ofício_Nº 3" → "oficio nº 3"), para casar com KEYWORD_RULES"""
+    decomposed = unicodedata.normalize('NFKD', text.lower().replace('_', ' '))
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def category_key(text):
+    return " ".join(fold_text(text).split())
+
+
+CATEGORY_KEYS = {category_key(category): category for category in CATEGORIES}
+
+
+def answer_fields(response_text):
+    """{'CATEGORIA': ..., 'NOME': ...} das linhas da resposta que trazem esses campos"""
+    fields = {}
+    for line in response_text.strip().splitlines():
+        match = ANSWER_FIELD_PATTERN.match(line)
+        if match:
+            fields[match.group(1).upper()] = match.group(2).strip()
+    return fields
+
+
+def keyword_scores(filename, content=""):
+    """Pontuação de cada categoria pelas palavras-chave no nome do arquivo e no conteúdo"""
+    scores = {}
+    for text, weight in ((filename, KEYWORD_FILENAME_WEIGHT), (content, 1)):
+        if not text:
+            continue
+        for match in KEYWORD_PATTERN.finditer(fold_text(text)):
+            category = KEYWORD_RULES[int(match.lastgroup[1:])][0]
+            scores[category] = scores.get(category, 0) + weight
+    return scores
+
+
+def classify_keywords(filename, content=""):
+    """Categoria de maior pontuação (Outros_Documentos se nenhuma palavra casar)"""
+    scores = keyword_scores(filename, content)
+    if not scores:
+        return "Outros_Documentos"
+    order = {category: index for index, (category, _) in enumerate(KEYWORD_RULES)}
+    return max(scores, key=lambda category: (scores[category], -order[category]))
+
+
+def line_fingerprint(line):
+    """Identifica uma linha sem diferenciar espaços, maiúsculas e acentos"""
+    return zlib.crc32(fold_text(" ".join(line.split())).encode('utf-8'))
+
+
+def content_lines(content):
+    """Impressões das linhas não vazias do trecho enviado à IA"""
+    return frozenset(line_fingerprint(line) for line in content[:PROMPT_CONTENT_CHARS].splitlines()
+                     if line.strip())
+
+
+def derive_name_from_content(content, max_length=60, exclude=frozenset()):
+    """Título a partir do próprio texto: a primeira linha com cara de título, ou None.
+    
+    Linhas cuja impressão está em exclude (o cabeçalho comum de um modelo) são ignoradas.
+    """
+    for line in content[:PROMPT_CONTENT_CHARS].splitlines():
+        if exclude and line_fingerprint(line) in exclude:
+            continue
+        line = " ".join(line.split())
+        words = [word for word in line.split() if sum(char.isalpha() for char in word) >= 2]
+        if len(line) < 8 or len(words) < 2 or len(words) * 2 < len(line.split()):
+            continue  # Curta demais ou só números/códigos
+        if len(line) > max_length:
+            line = line[:max_length].rsplit(' ', 1)[0]
+        return line.strip(" .,;:-")
+    return None
+
+
+# =============== MODELO LOCAL DE PRÉ-CLASSIFICAÇÃO ===============
+# Naive Bayes multinomial sobre saco de palavras com hashing, treinado de forma
+# incremental com as decisões do Gemini. Quando está confiante, responde sem
+# chamar a API. Requer NumPy (opcional).
+DEFAULT_LOCAL_MODEL_FILE = "organizer_local_model.npz"
+LOCAL_MODEL_FEATURES = 2 ** 16        # Baldes do hashing de palavras
+DEFAULT_LOCAL_MODEL_THRESHOLD = 0.95  # Confiança mínima para dispensar a IA
+DEFAULT_LOCAL_AUDIT_RATE = 0.05       # Fração das respostas confiantes conferida mesmo assim pela IA
+LOCAL_MODEL_MIN_DOCS = 50             # Documentos aprendidos antes de o modelo responder
+LOCAL_MODEL_MIN_CLASS_DOCS = 5        # E exemplos mínimos da categoria prevista
+LOCAL_MODEL_ALPHA = 0.1               # Suavização de Laplace
+LOCAL_MODEL_TEMPLATE_LINE_DOCS = 3    # Linha vista em tantos documentos aprendidos é de modelo (timbre, cabeçalho)
+LOCAL_MODEL_MAX_LINES = 100000        # Impressões de linhas guardadas; acima disso saem as mais raras
+TOKEN_PATTERN = re.compile(r'[a-z0-9]{2,}')
+
+
+class LocalClassifier:
+    """Pré-classificador local persistido em .npz.
+    
+    Cada decisão do Gemini passa primeiro por uma previsão (avaliação
+    prequencial: testa e depois treina), de modo que as estatísticas medem a
+    concordância em documentos que o modelo ainda não tinha visto. Conta
+    também em quantos documentos cada linha apareceu: linhas repetidas são
+    timbre ou cabeçalho de modelo e não servem de nome.
+    """
+
+    def __init__(self, path=DEFAULT_LOCAL_MODEL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.categories = list(CATEGORIES)
+        self.counts = np.zeros((len(self.categories), LOCAL_MODEL_FEATURES), dtype=np.float32)
+        self.docs = np.zeros(len(self.categories), dtype=np.int64)
+        self.line_docs = {}  # impressão da linha → documentos aprendidos que a contêm
+        self.stats = {'avaliados': 0, 'concordancias': 0, 'confiantes': 0,
+                      'confiantes_concordancias': 0, 'economizadas': 0}
+        self.dirty = False
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            # Categorias ou tamanho diferentes: modelo antigo é descartado
+            if list(data['categories']) != self.categories or data['counts'].shape != self.counts.shape:
+                return
+            self.counts = data['counts'].astype(np.float32)
+            self.docs = data['docs'].astype(np.int64)
+            self.stats.update(json.loads(str(data['stats'])))
+            if 'line_keys' in data.files:  # Ausente em modelos antigos
+                self.line_docs = dict(zip(data['line_keys'].tolist(), data['line_docs'].tolist()))
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                np.savez_compressed(f, categories=np.array(self.categories), counts=self.counts,
+                                    docs=self.docs, stats=np.array(json.dumps(self.stats)),
+                                    line_keys=np.array(list(self.line_docs), dtype=np.uint32),
+                                    line_docs=np.array(list(self.line_docs.values()), dtype=np.int64))
+            os.replace(temp_path, self.path)
+            self.dirty = False
+
+    @staticmethod
+    def features(content, filename):
+        """Índices e contagens das palavras (as do nome do arquivo ganham prefixo próprio)"""
+        tokens = TOKEN_PATTERN.findall(fold_text(content[:PROMPT_CONTENT_CHARS]))
+        tokens += ["@" + token for token in TOKEN_PATTERN.findall(fold_text(Path(filename).stem))]
+        if not tokens:
+            return None, None
+        hashed = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens),
+                             dtype=np.int64, count=len(tokens)) % LOCAL_MODEL_FEATURES
+        return np.unique(hashed, return_counts=True)
+
+    def _predict(self, indices, counts):
+        total = int(self.docs.sum())
+        if indices is None or total < LOCAL_MODEL_MIN_DOCS:
+            return None, 0.0
+        # log P(c) + Σ n_i log P(palavra_i | c), só nas colunas presentes no documento
+        priors = np.log((self.docs + 1) / (total + len(self.categories)))
+        totals = self.counts.sum(axis=1, keepdims=True) + LOCAL_MODEL_ALPHA * LOCAL_MODEL_FEATURES
+        likelihood = np.log((self.counts[:, indices] + LOCAL_MODEL_ALPHA) / totals) @ counts
+        scores = priors + likelihood
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        if self.docs[best] < LOCAL_MODEL_MIN_CLASS_DOCS:
+            return None, 0.0
+        return self.categories[best], float(probabilities[best])
+
+    def predict(self, content, filename):
+        """(categoria, confiança); (None, 0.0) se o modelo ainda não pode opinar"""
+        indices, counts = self.features(content, filename)
+        with self.lock:
+            return self._predict(indices, counts)
+
+    def learn(self, content, filename, category, threshold=DEFAULT_LOCAL_MODEL_THRESHOLD):
+        """Registra a decisão da IA: avalia a previsão atual e depois treina com ela"""
+        if category not in self.categories:
+            return
+        indices, counts = self.features(content, filename)
+        if indices is None:
+            return
+        with self.lock:
+            predicted, confidence = self._predict(indices, counts)
+            if predicted is not None:
+                agree = predicted == category
+                self.stats['avaliados'] += 1
+                self.stats['concordancias'] += agree
+                if confidence >= threshold:
+                    self.stats['confiantes'] += 1
+                    self.stats['confiantes_concordancias'] += agree
+            row = self.categories.index(category)
+            self.counts[row, indices] += counts
+            self.docs[row] += 1
+            self._count_lines(content)
+            self.dirty = True
+
+    def _count_lines(self, content):
+        line_docs = self.line_docs
+        for line in content_lines(content):
+            line_docs[line] = line_docs.get(line, 0) + 1
+        minimum = 1
+        while len(line_docs) > LOCAL_MODEL_MAX_LINES:
+            # Saem primeiro as linhas vistas em menos documentos (as que não são de modelo)
+            self.line_docs = line_docs = {line: docs for line, docs in line_docs.items() if docs > minimum}
+            minimum += 1
+
+    def template_lines(self, content):
+        """Impressões das linhas de content que se repetem nos documentos aprendidos"""
+        with self.lock:
+            return frozenset(line for line in content_lines(content)
+                             if self.line_docs.get(line, 0) >= LOCAL_MODEL_TEMPLATE_LINE_DOCS)
+
+    def record_saved(self):
+        with self.lock:
+            self.stats['economizadas'] += 1
+            self.dirty = True
+
+    def summary(self):
+        """Números da avaliação prequencial (concordâncias em fração; None sem avaliações)"""
+        with self.lock:
+            stats = dict(self.stats)
+            learned = int(self.docs.sum())
+        share = lambda part, whole: round(part / whole, 4) if whole else None
+        return {'aprendidos': learned,
+                'avaliados': stats['avaliados'],
+                'concordancia': share(stats['concordancias'], stats['avaliados']),
+                'confiantes': stats['confiantes'],
+                'concordancia_confiantes': share(stats['confiantes_concordancias'], stats['confiantes']),
+                'economizadas': stats['economizadas']}
+
+    def evaluation(self):
+        """Resumo da avaliação prequencial contra as decisões do Gemini"""
+        summary = self.summary()
+        rate = lambda value: f"{100 * value:.1f}%" if value is not None else "—"
+        return (f"Documentos aprendidos: {summary['aprendidos']}\n"
+                f"Avaliados antes de aprender: {summary['avaliados']}\n"
+                f"Concordância com o Gemini: {rate(summary['concordancia'])}\n"
+                f"Quando confiante: {rate(summary['concordancia_confiantes'])} "
+                f"em {summary['confiantes']} documentos\n"
+                f"Chamadas à IA economizadas: {summary['economizadas']}")
+
+
+# =============== CACHE DE CLASSIFICAÇÕES ===============
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+DEFAULT_CACHE_FILE = "organizer_cache.sqlite"
+DEFAULT_CACHE_MAX_ENTRIES = 200000
+
+
+class ClassificationCache:
+    """Cache persistente (SQLite) de classificações com despejo LRU.
+    
+    A chave combina o conteúdo enviado ao modelo, o nome do arquivo, a versão
+    do prompt e o modelo; entradas de outras versões do prompt são descartadas
+    ao abrir o cache.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS classifications (
+                                 key TEXT PRIMARY KEY,
+                                 prompt_version TEXT NOT NULL,
+                                 category TEXT NOT NULL,
+                                 name TEXT NOT NULL,
+                                 last_used REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON classifications (last_used)")
+        self.invalidate(keep_version=PROMPT_VERSION)
+
+    @staticmethod
+    def make_key(content, filename, model_name):
+        digest = hashlib.sha256()
+        for part in (PROMPT_VERSION, model_name, filename, content[:PROMPT_CONTENT_CHARS]):
+            digest.update(part.encode('utf-8', errors='ignore'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT category, name FROM classifications WHERE key = ?",
+                                    (key,)).fetchone()
+            if row is None or row[0] not in CATEGORIES:
+                # Respostas sem categoria válida gravadas por versões antigas não valem
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE classifications SET last_used = ? WHERE key = ?",
+                              (time.time(), key))
+            return {'category': row[0], 'name': row[1]}
+
+    def put(self, key, result):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                              (key, PROMPT_VERSION, result['category'], result['name'], time.time()))
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                self._evict()
+
+    def _evict(self):
+        """Mantém no máximo max_entries, descartando as menos usadas recentemente"""
+        count = self.conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute("""DELETE FROM classifications WHERE key IN (
+                                     SELECT key FROM classifications ORDER BY last_used LIMIT ?)""",
+                              (excess,))
+
+    def invalidate(self, keep_version=None):
+        """Apaga o cache inteiro ou só as entradas de versões diferentes de keep_version"""
+        with self.lock:
+            if keep_version is None:
+                self.conn.execute("DELETE FROM classifications")
+            else:
+                self.conn.execute("DELETE FROM classifications WHERE prompt_version != ?",
+                                  (keep_version,))
+            self._evict()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# =============== DUPLICATAS EXATAS ===============
+# 'link': cópias idênticas vão para o destino pelo modo de saída (movidas em
+#         'move'); em 'copy' viram hardlinks do arquivo já organizado
+# 'skip': cópias idênticas não vão para o destino (só aparecem no relatório)
+# 'off':  cada cópia é classificada e copiada normalmente
+DEFAULT_DUPLICATES_MODE = 'link'
+DEFAULT_HASH_WORKERS = 4
+
+_HASHED = object()  # Marca: o primeiro arquivo deste tamanho já foi registrado
+
+
+def file_digest(path):
+    """Hash BLAKE2b do conteúdo do arquivo"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DuplicateDetector:
+    """Detecta duplicatas exatas em fluxo, agrupando por tamanho e depois por hash.
+    
+    Um arquivo só é lido quando outro do mesmo tamanho aparece. Os hashes são
+    calculados em paralelo, mas o tamanho e o hash de cada job são registrados
+    na ordem de descoberta (numbered): o principal de cada grupo de conteúdo
+    idêntico é sempre o primeiro descoberto, em qualquer execução.
+    """
+
+    def __init__(self, log=None):
+        self.log = log or (lambda message: None)
+        self.turn = threading.Condition()
+        self.sized = 0       # Próximo seq a registrar o tamanho
+        self.registered = 0  # Próximo seq a registrar o hash
+        self.first_by_size = {}  # tamanho → primeiro job visto (ainda sem hash) ou _HASHED
+        self.primaries = {}      # (tamanho, hash) → job principal
+        self.cancelled = False   # Pipeline interrompido: jobs anteriores podem nunca chegar
+
+    def cancel(self):
+        """Libera quem espera a vez (os jobs seguintes não são mais processados)"""
+        with self.turn:
+            self.cancelled = True
+            self.turn.notify_all()
+
+    def numbered(self, jobs):
+        """Numera os jobs na ordem de descoberta (a ordem das decisões de check)"""
+        for seq, job in enumerate(jobs):
+            job.seq = seq
+            yield job
+
+    def check(self, job):
+        """Retorna o job principal se job for duplicata exata de um arquivo anterior.
+        
+        Todo job numerado deve passar por aqui uma vez: os seguintes esperam a vez dele.
+        """
+        with self.turn:
+            self.turn.wait_for(lambda: self.sized == job.seq or self.cancelled)
+            first = None
+            if job.size:
+                first = self.first_by_size.get(job.size)
+                self.first_by_size[job.size] = job if first is None else _HASHED
+            self.sized += 1
+            self.turn.notify_all()
+
+        first_key = key = None
+        try:
+            if first is not None:
+                if first is not _HASHED:
+                    first_key = self._key(first)  # O primeiro deste tamanho só é lido agora
+                key = self._key(job)
+        finally:
+            with self.turn:
+                self.turn.wait_for(lambda: self.registered == job.seq or self.cancelled)
+                # O primeiro do tamanho é anterior a qualquer outro job com o mesmo hash
+                if first_key is not None:
+                    self.primaries.setdefault(first_key, first)
+                primary = self.primaries.setdefault(key, job) if key is not None else job
+                self.registered += 1
+                self.turn.notify_all()
+        return None if primary is job else primary
+
+    def _key(self, job):
+        # No modo 'move' o primeiro arquivo pode já ter saído da origem
+        for path in (job.path, job.final_path):
+            if path:
+                try:
+                    return job.size, file_digest(path)
+                except OSError:
+                    continue
+        self.log(f"⚠️ Não foi possível ler {job.filename} para detectar duplicatas")
+        return None
+
+
+# =============== MODOS DE SAÍDA ===============
+# copy: cópia completa (padrão)   move: move/renomeia a origem
+# hardlink / reflink / symlink: sem duplicar bytes quando o sistema permite
+# auto: mesmo disco → reflink (ou copy se não houver suporte); outro disco → copy.
+#       Nunca hardlink: o arquivo organizado dividiria o inode com o original
+OUTPUT_MODES = ('copy', 'move', 'hardlink', 'reflink', 'symlink', 'auto')
+DEFAULT_OUTPUT_MODE = 'copy'
+FICLONE = 0x40049409  # ioctl do Linux para clonar arquivos (btrfs, XFS, ...)
+# Erros que significam "o sistema de arquivos não oferece este modo"; qualquer
+# outro (nome ocupado, origem sumiu, sem permissão na pasta) é do arquivo
+UNSUPPORTED_ERRNOS = frozenset(code for code in (
+    errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP,
+    getattr(errno, 'ENOTTY', None),  # ioctl FICLONE desconhecido do sistema de arquivos
+) if code is not None)
+UNSUPPORTED_WINERRORS = frozenset((
+    1,     # ERROR_INVALID_FUNCTION (FAT/exFAT sem hardlinks)
+    17,    # ERROR_NOT_SAME_DEVICE
+    50,    # ERROR_NOT_SUPPORTED
+    1314,  # ERROR_PRIVILEGE_NOT_HELD (symlink sem o Modo de Desenvolvedor)
+))
+
+
+def is_unsupported_error(error):
+    """O erro indica que o modo de saída não é suportado aqui (e não uma falha do arquivo)?"""
+    return (error.errno in UNSUPPORTED_ERRNOS
+            or getattr(error, 'winerror', None) in UNSUPPORTED_WINERRORS)
+
+
+def same_device(path_a, path_b):
+    """As duas pastas estão no mesmo sistema de arquivos?"""
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def reflink_file(src, dst):
+    """Clona o arquivo compartilhando blocos (copy-on-write); OSError se não houver suporte"""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+            raise
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+    else:
+        raise OSError(errno.EOPNOTSUPP, "reflink não suportado neste sistema")
+    shutil.copystat(src, dst)
+
+
+def publish_file(src, dst):
+    """Renomeia src para dst sem nunca sobrescrever: FileExistsError se dst já existir"""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # Sem hardlinks (FAT, exFAT, alguns compartilhamentos): reserva o nome com
+        # O_EXCL e troca o marcador vazio, que é nosso, pelo arquivo
+        os.close(os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        try:
+            os.replace(src, dst)
+        except BaseException:
+            os.remove(dst)
+            raise
+        return
+    os.remove(src)
+
+
+class OutputMaterializer:
+    """Coloca o arquivo no destino conforme o modo de saída escolhido.
+    
+    Modos que dependem do sistema de arquivos (reflink, hardlink, symlink)
+    caem para copy no primeiro erro de "não suportado" e não tentam de novo;
+    outros erros são do arquivo e sobem. Nenhum modo sobrescreve: se dst já
+    existir, place levanta FileExistsError.
+    """
+
+    def __init__(self, mode, input_path=None, output_path=None, log=None):
+        self.log = log or (lambda message: None)
+        self.fallback = {'reflink': 'copy', 'hardlink': 'copy', 'symlink': 'copy'}
+        if mode == 'auto':
+            same_disk = input_path and output_path and same_device(input_path, output_path)
+            mode = 'reflink' if same_disk else 'copy'
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Modo de saída inválido: {mode}")
+        self.mode = mode
+        self.lock = threading.Lock()
+
+    def place(self, src, dst):
+        """Materializa src em dst; retorna o modo efetivamente usado"""
+        mode = self.mode
+        while True:
+            try:
+                self._place(mode, src, dst)
+                return mode
+            except OSError as e:
+                if mode not in self.fallback or not is_unsupported_error(e):
+                    raise
+                next_mode = self.fallback[mode]
+                with self.lock:
+                    if self.mode == mode:
+                        self.mode = next_mode
+                        self.log(f"⚠️ Modo '{mode}' indisponível ({str(e)}); usando '{next_mode}'")
+                mode = next_mode
+
+    def _place(self, mode, src, dst):
+        if mode == 'hardlink':
+            os.link(src, dst)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+        elif mode == 'move' and same_device(src, os.path.dirname(dst)):
+            publish_file(src, dst)
+        else:
+            # Cópias passam por um nome temporário: uma queda no meio não deixa
+            # arquivo pela metade com o nome final. O '.parcial' é sempre uma
+            # cópia: em 'move' (outro disco) a origem só sai depois da publicação,
+            # então uma falha nunca apaga a única cópia do arquivo
+            partial_path = dst + ".parcial"
+            try:
+                if mode == 'reflink':
+                    reflink_file(src, partial_path)
+                else:
+                    shutil.copy2(src, partial_path)
+                publish_file(partial_path, dst)
+            except BaseException:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+            if mode == 'move':
+                os.remove(src)
+
+
+class DestinationIndex:
+    """Índice em memória dos nomes ocupados em cada pasta de categoria.
+    
+    Cada pasta é lida uma única vez (os.scandir) na primeira vez que recebe um
+    arquivo; depois disso o próximo sufixo livre "Nome (n)" sai em O(1), sem
+    os.path.exists por candidato. Nomes são comparados sem diferenciar
+    maiúsculas, como no Windows.
+    """
+
+    def __init__(self, output_base):
+        self.output_base = output_base
+        self.lock = threading.Lock()
+        self.categories = {}  # categoria → {'lock', 'names' (ocupados), 'suffixes' (próximo n)}
+
+    def _category(self, category):
+        with self.lock:
+            entry = self.categories.get(category)
+            if entry is None:
+                entry = self.categories[category] = {'lock': threading.Lock(),
+                                                     'names': None, 'suffixes': {}}
+        return entry
+
+    def reserve(self, category, base_name, extension):
+        """Reserva e retorna o nome final livre para base_name + extension"""
+        entry = self._category(category)
+        with entry['lock']:
+            if entry['names'] is None:
+                entry['names'] = self._load(category)
+            names = entry['names']
+            suffixes = entry['suffixes']
+
+            final_name = f"{base_name}{extension}"
+            if final_name.lower() in names:
+                key = (base_name.lower(), extension.lower())
+                counter = suffixes.get(key, 1)
+                while f"{base_name} ({counter}){extension}".lower() in names:
+                    counter += 1
+                suffixes[key] = counter + 1
+                final_name = f"{base_name} ({counter}){extension}"
+
+            names.add(final_name.lower())
+            return final_name
+
+    def _load(self, category):
+        """Cria a pasta da categoria (se preciso) e lê os nomes já existentes"""
+        folder = os.path.join(self.output_base, category)
+        os.makedirs(folder, exist_ok=True)
+        with os.scandir(folder) as entries:
+            return {entry.name.lower() for entry in entries}
+
+
+class RunContext:
+    """Estado de uma execução origem → destino compartilhado pelos estágios"""
+
+    def __init__(self, input_path, output_path, journal=None, materializer=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.journal = journal
+        self.materializer = materializer or OutputMaterializer('copy')
+        self.index = DestinationIndex(output_path)
+        self.extraction_errors = []  # [{'arquivo', 'tipo', 'detalhe'}] para o relatório
+        # Imagens idênticas (mesmo JPEG reduzido) são classificadas uma única vez por execução
+        self.image_results = {}
+        self.image_lock = threading.Lock()
+        self.images_reused = 0
+
+
+# =============== DIÁRIO DE PROCESSAMENTO ===============
+WORK_FOLDER = ".omnifile"  # Pasta de controle criada dentro da pasta de destino
+
+
+class ProcessingJournal:
+    """Diário append-only (JSON lines) de uma execução origem → destino.
+    
+    Cada arquivo copiado vira uma linha com origem, tamanho/mtime, decisão e
+    destino. Se a execução anterior não chegou ao fim, o diário é retomado e
+    os arquivos já concluídos (e inalterados) são pulados.
+    """
+
+    def __init__(self, output_base, input_base):
+        folder = os.path.join(output_base, WORK_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        # Uma execução é o par origem → destino: outra origem no mesmo destino tem diário próprio
+        pair = os.path.abspath(input_base) + "\0" + os.path.abspath(output_base)
+        run_id = hashlib.sha1(pair.encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(folder, f"journal-{run_id}.jsonl")
+        self.completed = {}
+        self._unsynced = 0
+        self.lock = threading.Lock()
+
+        needs_newline = self._load()
+        if self.resumed:
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if needs_newline:
+                self.file.write("\n")  # A última linha foi cortada pela queda
+        else:
+            self.file = open(self.path, 'w', encoding='utf-8')
+            self._write({'event': 'inicio', 'input': os.path.abspath(input_base),
+                         'output': os.path.abspath(output_base),
+                         'started': datetime.now().isoformat(timespec='seconds')})
+
+    def _load(self):
+        """Lê o diário existente; retorna True se a última linha está incompleta"""
+        self.resumed = False
+        if not os.path.exists(self.path):
+            return False
+
+        finished = False
+        completed = {}
+        last_line = "\n"
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                last_line = line
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('event') == 'fim':
+                    finished = True
+                elif 'src' in entry:
+                    completed[entry['src']] = (entry.get('size'), entry.get('mtime'))
+
+        if not finished:
+            self.resumed = True
+            self.completed = completed
+        return not last_line.endswith("\n")
+
+    def is_done(self, job):
+        """O arquivo já foi concluído numa execução interrompida (e não mudou)?"""
+        return self.completed.get(job.path) == (job.size, job.mtime)
+
+    def record(self, job):
+        self._write({'src': job.path, 'size': job.size, 'mtime': job.mtime,
+                     'category': job.result['category'], 'name': job.result['name'],
+                     'dest': job.final_path})
+
+    def finish(self):
+        self._write({'event': 'fim', 'finished': datetime.now().isoformat(timespec='seconds')})
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+
+    def _write(self, entry):
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+            self._unsynced += 1
+            if self._unsynced >= 100:
+                os.fsync(self.file.fileno())
+                self._unsynced = 0
+
+
+# =============== QUASE-DUPLICATAS (MinHash/LSH) ===============
+# Documentos de modelo (ofícios, pareceres) que só mudam nomes, números e datas
+# reaproveitam a categoria de um vizinho já classificado pela IA
+NEAR_DUPLICATES_FILE = "quase_duplicatas.jsonl"  # Dentro de <destino>/.omnifile
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.7  # Similaridade de Jaccard estimada mínima
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16                      # 16 faixas x 4 linhas
+MINHASH_SHINGLE_WORDS = 3
+MINHASH_SEED = 20240601                 # Fixo: assinaturas gravadas continuam comparáveis
+MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_PARAMS = [(random.Random(MINHASH_SEED + i).randrange(1, MINHASH_PRIME),
+                    random.Random(-MINHASH_SEED - i).randrange(0, MINHASH_PRIME))
+                   for i in range(MINHASH_PERMUTATIONS)]
+
+
+def minhash_signature(content):
+    """Assinatura MinHash (bytes) dos trigramas de palavras; None se o texto for curto demais"""
+    # Dígitos viram 0: números e datas diferentes não afastam documentos do mesmo modelo
+    words = TOKEN_PATTERN.findall(re.sub(r'\d', '0', fold_text(content[:PROMPT_CONTENT_CHARS])))
+    shingles = {zlib.crc32(" ".join(words[i:i + MINHASH_SHINGLE_WORDS]).encode('utf-8'))
+                for i in range(len(words) - MINHASH_SHINGLE_WORDS + 1)}
+    if not shingles:
+        return None
+    signature = array.array('I', (min((a * shingle + b) % MINHASH_PRIME for shingle in shingles) & 0xFFFFFFFF
+                                  for a, b in _MINHASH_PARAMS))
+    return signature.tobytes()
+
+
+class NearDuplicateIndex:
+    """Índice LSH de assinaturas MinHash com a categoria decidida pela IA.
+    
+    Guarda também as impressões das linhas de cada documento: o que um vizinho
+    tem em comum é o texto do modelo, e o nome sai do que sobra. Persistido em
+    JSON lines ao lado dos resultados, então vale entre execuções com o mesmo
+    destino.
+    """
+
+    def __init__(self, output_base, threshold=DEFAULT_NEAR_DUPLICATE_THRESHOLD):
+        folder = os.path.join(output_base, WORK_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, NEAR_DUPLICATES_FILE)
+        self.threshold = threshold
+        self.entries = []   # [(assinatura, categoria, impressões das linhas ou None)]
+        self.buckets = {}   # (faixa, trecho da assinatura) → índices em entries
+        self.reused = 0
+        self.lock = threading.Lock()
+        self.band_size = MINHASH_PERMUTATIONS * 4 // MINHASH_BANDS  # Bytes por faixa
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        signature = bytes.fromhex(entry['assinatura'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Linha cortada ou de outro formato
+                    if len(signature) == MINHASH_PERMUTATIONS * 4 and entry.get('categoria') in CATEGORIES:
+                        lines = entry.get('linhas')  # Ausente em índices antigos
+                        self._insert(signature, entry['categoria'],
+                                     frozenset(lines) if isinstance(lines, list) else None)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _bands(self, signature):
+        return [(band, signature[band * self.band_size:(band + 1) * self.band_size])
+                for band in range(MINHASH_BANDS)]
+
+    def _insert(self, signature, category, lines):
+        index = len(self.entries)
+        self.entries.append((signature, category, lines))
+        for key in self._bands(signature):
+            self.buckets.setdefault(key, []).append(index)
+
+    def lookup(self, signature):
+        """(categoria, similaridade, linhas) do vizinho mais parecido acima do limiar,
+        ou (None, 0.0, None)"""
+        query = array.array('I', signature)
+        best, best_similarity = None, 0.0
+        with self.lock:
+            candidates = {index for key in self._bands(signature) for index in self.buckets.get(key, ())}
+            for index in candidates:
+                stored = self.entries[index]
+                similarity = sum(x == y for x, y in zip(query, array.array('I', stored[0]))) / MINHASH_PERMUTATIONS
+                if similarity > best_similarity:
+                    best, best_similarity = stored, similarity
+        if best_similarity < self.threshold:
+            return None, 0.0, None
+        return best[1], best_similarity, best[2]
+
+    def record_reuse(self):
+        with self.lock:
+            self.reused += 1
+
+    def add(self, signature, category, lines):
+        if category not in CATEGORIES:
+            return
+        with self.lock:
+            self._insert(signature, category, lines)
+            self.file.write(json.dumps({'assinatura': signature.hex(), 'categoria': category,
+                                        'linhas': sorted(lines)}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+# =============== LIMITES DE TAXA DA API ===============
+DEFAULT_RATE_LIMITS = {
+    'rpm': 1000,               # Requisições por minuto
+    'tpm': 4000000,            # Tokens por minuto
+    'max_concurrency': 16,     # Teto da concorrência adaptativa
+    'timeout': 60,             # Timeout por requisição (s)
+    'max_retries': 5,
+    'backoff_base': 1.0,       # Backoff exponencial (s), com jitter
+    'backoff_max': 60.0,
+    'breaker_failures': 5,     # Quedas seguidas (5xx, timeout, rede; 429 não conta) que abrem o circuito
+    'breaker_cooldown': 30.0,  # Tempo com o circuito aberto (s)
+    'breaker_max_wait': 300.0, # Espera máxima por circuito fechado antes de desistir
+}
+
+
+class CircuitOpenError(Exception):
+    """Circuito aberto por tempo demais: a API está indisponível"""
+
+
+def is_rate_limit_error(error):
+    """Erro de cota (HTTP 429 / ResourceExhausted)"""
+    return (type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+            or '429' in str(error))
+
+
+def is_transient_error(error):
+    """Erros que valem nova tentativa: cota, timeout, indisponibilidade, rede"""
+    transient_names = ('DeadlineExceeded', 'ServiceUnavailable', 'InternalServerError',
+                       'GatewayTimeout', 'RetryError', 'Aborted', 'Unknown')
+    return (is_rate_limit_error(error)
+            or type(error).__name__ in transient_names
+            or isinstance(error, (TimeoutError, ConnectionError)))
+
+
+class TokenBucket:
+    """Balde de tokens reabastecido continuamente (capacidade = 1 minuto)"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # Pedidos maiores que a capacidade esperam o balde encher por completo
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+
+class AdaptiveConcurrency:
+    """Limite de concorrência AIMD: cresce +1 por janela de sucessos e cai pela
+    metade em erro de cota ou quando a latência sobe muito acima da linha de base"""
+
+    def __init__(self, max_limit, initial=4, latency_factor=2.0):
+        self.max_limit = max(1, int(max_limit))
+        self.limit = float(min(initial, self.max_limit))
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def on_success(self, latency):
+        with self.cond:
+            if self.baseline is None:
+                self.baseline = latency
+            # Linha de base acompanha o mínimo recente e sobe devagar
+            self.baseline = min(latency, self.baseline * 1.01)
+            if latency > self.baseline * self.latency_factor:
+                self._decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+    def on_overload(self):
+        with self.cond:
+            self._decrease()
+
+    def _decrease(self):
+        # Uma redução por segundo: uma rajada de 429 não derruba o limite a zero
+        now = time.monotonic()
+        if now - self.last_decrease >= 1.0:
+            self.limit = max(1.0, self.limit / 2)
+            self.last_decrease = now
+
+
+class CircuitBreaker:
+    """Abre após falhas de indisponibilidade seguidas; depois do cooldown libera uma única sonda"""
+
+    def __init__(self, failures, cooldown):
+        self.threshold = max(1, int(failures))
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """0 se a chamada pode seguir; senão, quanto esperar antes de tentar de novo"""
+        with self.lock:
+            if self.failures < self.threshold:
+                return 0.0
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return 0.5
+            self.probing = True  # Meio-aberto: esta chamada é a sonda
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        """Registra falha; retorna True se o circuito acabou de abrir"""
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self.cooldown
+                return self.failures == self.threshold
+            return False
+
+
+class RateLimiter:
+    """Limitador compartilhado das chamadas à IA: RPM/TPM, concorrência AIMD,
+    retry com backoff exponencial e jitter, timeout por requisição e circuit breaker"""
+
+    def __init__(self, limits=None, log=None):
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.limits.update(limits or {})
+        self.log = log or (lambda message: None)
+        self.requests = TokenBucket(self.limits['rpm'])
+        self.tokens = TokenBucket(self.limits['tpm'])
+        self.concurrency = AdaptiveConcurrency(self.limits['max_concurrency'])
+        self.breaker = CircuitBreaker(self.limits['breaker_failures'], self.limits['breaker_cooldown'])
+
+    @staticmethod
+    def estimate_tokens(prompt):
+        # ~4 caracteres por token, mais uma folga para a resposta
+        return len(prompt) // 4 + 64
+
+    def call(self, func, tokens=0):
+        """Executa func(timeout) respeitando os limites; relança o último erro
+        quando as tentativas se esgotam ou o erro não é transitório"""
+        limits = self.limits
+        attempt = 0
+        waited = 0.0
+
+        while True:
+            wait = self.breaker.wait_time()
+            if wait > 0:
+                if waited >= limits['breaker_max_wait']:
+                    raise CircuitOpenError("API indisponível (circuito aberto)")
+                time.sleep(wait)
+                waited += wait
+                continue
+
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                result = func(limits['timeout'])
+            except Exception as e:
+                self.concurrency.release()
+                if (is_rate_limit_error(e) or type(e).__name__ == 'DeadlineExceeded'
+                        or isinstance(e, TimeoutError)):
+                    self.concurrency.on_overload()
+                if not is_transient_error(e):
+                    self.breaker.record_success()  # A API respondeu; o erro é do pedido
+                    raise
+                if is_rate_limit_error(e):
+                    # Cota esgotada não é queda: o AIMD e o backoff já tratam
+                    self.breaker.record_success()
+                elif self.breaker.record_failure():
+                    self.log(f"⛔ API instável - pausando chamadas por {limits['breaker_cooldown']:.0f}s")
+                if attempt >= limits['max_retries']:
+                    raise
+                delay = min(limits['backoff_max'], limits['backoff_base'] * (2 ** attempt))
+                time.sleep(random.uniform(delay / 2, delay))
+                attempt += 1
+                continue
+
+            self.concurrency.release()
+            self.concurrency.on_success(time.monotonic() - started)
+            self.breaker.record_success()
+            return result
+
+
+# =============== BACKENDS DE CLASSIFICAÇÃO ===============
+# Todos respondem generate(prompt, imagem, timeout) → texto no formato
+# CATEGORIA/NOME; parse_response, validate_filename e a nomeação não mudam
+DEFAULT_CLASSIFIER_BACKEND = 'gemini'
+DEFAULT_HTTP_POOL_SIZE = 16  # Conexões keep-alive ociosas guardadas (≈ max_concurrency)
+DEFAULT_BACKEND_OPTIONS = {
+    'openai': {
+        'base_url': "http://127.0.0.1:8000/v1",  # Servidor compatível: vLLM, llama.cpp, Ollama...
+        'model': "local-model",
+        'api_key': "",
+        'pool_size': DEFAULT_HTTP_POOL_SIZE,
+    },
+    'stub': {
+        'latency_ms': 50,
+        'jitter_ms': 0,
+        'rate_limit_rate': 0.0,  # Fração das chamadas que recebe 429
+        'error_rate': 0.0,       # ... 503
+        'timeout_rate': 0.0,     # ... timeout
+        'seed': 0,
+    },
+}
+STUB_FILENAME_PATTERN = re.compile(r'^NOME ORIGINAL: (.*)$', re.MULTILINE)
+STUB_DOC_PATTERN = re.compile(r'^=== DOC (\d+) ===$', re.MULTILINE)
+STUB_MAX_TRACKED_PROMPTS = 10000  # Prompts com tentativas em andamento guardados pelo stub
+
+
+class BackendError(Exception):
+    """Erro HTTP de um backend. As subclasses têm os nomes das exceções do
+    google.api_core, que is_transient_error/is_rate_limit_error já reconhecem"""
+    status = None
+
+
+class TooManyRequests(BackendError):
+    status = 429
+
+
+class InternalServerError(BackendError):
+    status = 500
+
+
+class ServiceUnavailable(BackendError):
+    status = 503
+
+
+class GatewayTimeout(BackendError):
+    status = 504
+
+
+BACKEND_ERRORS = {error.status: error for error in (TooManyRequests, InternalServerError,
+                                                     ServiceUnavailable, GatewayTimeout)}
+
+
+def backend_error(status, detail):
+    return BACKEND_ERRORS.get(status, BackendError)(f"HTTP {status}: {detail}")
+
+
+class HTTPConnectionPool:
+    """Conexões HTTP(S) keep-alive (http.client) reaproveitadas entre requisições.
+    
+    Cada requisição pega uma conexão ociosa ou abre outra; na devolução, até
+    `size` ficam guardadas. Uma conexão ociosa que o servidor já fechou é
+    descartada e a requisição segue em outra.
+    """
+
+    def __init__(self, base_url, size=DEFAULT_HTTP_POOL_SIZE):
+        url = urlsplit(base_url)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"URL inválida: {base_url}")
+        self.connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip('/')
+        self.size = max(1, int(size))
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0  # Conexões abertas até agora (reuso = requisições - opened)
+
+    def _acquire(self, timeout):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.opened += 1
+        if conn is None:
+            return self.connection_class(self.host, self.port, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        """(status, corpo da resposta)"""
+        while True:
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused and not isinstance(e, TimeoutError):
+                    continue  # Conexão ociosa fechada pelo servidor: tenta em outra
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+class ClassifierBackend:
+    """Interface dos backends de classificação"""
+    name = None
+    model_id = None        # Entra na chave do cache: respostas de backends diferentes não se misturam
+    authoritative = True   # Decisões treinam o modelo local e alimentam o índice de quase-duplicatas
+
+    def generate(self, prompt, image=None, timeout=None):
+        """Texto da resposta; image é um JPEG (bytes) ou None"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GeminiBackend(ClassifierBackend):
+    """Google Gemini. O cliente gRPC mantém um único canal HTTP/2 persistente,
+    multiplexado entre as requisições concorrentes"""
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL_NAME):
+        import google.generativeai as genai  # Pesado (gRPC): só quando o Gemini é usado
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.model_id = model_name  # Mantém válidas as chaves já gravadas no cache
+
+    def generate(self, prompt, image=None, timeout=None):
+        contents = prompt
+        if image is not None:
+            contents = [prompt, {'mime_type': 'image/jpeg', 'data': image}]
+        options = {'timeout': timeout} if timeout else {}
+        return self.model.generate_content(contents, request_options=options).text
+
+
+class OpenAICompatibleBackend(ClassifierBackend):
+    """Servidor compatível com a API da OpenAI (POST /chat/completions)"""
+    name = 'openai'
+
+    def __init__(self, base_url=DEFAULT_BACKEND_OPTIONS['openai']['base_url'],
+                 model=DEFAULT_BACKEND_OPTIONS['openai']['model'], api_key="",
+                 pool_size=DEFAULT_HTTP_POOL_SIZE):
+        self.model = model
+        self.model_id = f"openai:{model}"
+        self.pool = HTTPConnectionPool(base_url, pool_size)
+        self.headers = {'Content-Type': 'application/json'}
+        if api_key:
+            self.headers['Authorization'] = f"Bearer {api_key}"
+
+    def generate(self, prompt, image=None, timeout=None):
+        content = prompt
+        if image is not None:
+            data_url = "data:image/jpeg;base64," + base64.b64encode(image).decode('ascii')
+            content = [{'type': 'text', 'text': prompt},
+                       {'type': 'image_url', 'image_url': {'url': data_url}}]
+        body = json.dumps({'model': self.model, 'temperature': 0,
+                           'messages': [{'role': 'user', 'content': content}]}).encode('utf-8')
+        status, data = self.pool.request('POST', '/chat/completions', body, self.headers, timeout)
+        if status != 200:
+            raise backend_error(status, data[:200].decode('utf-8', 'replace'))
+        try:
+            return json.loads(data)['choices'][0]['message']['content'] or ""
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise BackendError(f"resposta inválida: {type(e).__name__}: {str(e)}")
+
+    def close(self):
+        self.pool.close()
+
+
+class StubBackend(ClassifierBackend):
+    """Backend local determinístico, para testes de carga e uso offline.
+    
+    Responde no formato do prompt (CATEGORIA/NOME, ou blocos DOC n em lote)
+    com a categoria por palavras-chave. Latência e erros (429, 503, timeout)
+    são sorteados por prompt e tentativa a partir de `seed`, então a mesma
+    execução se repete igual com qualquer número de threads.
+    """
+    name = 'stub'
+    model_id = 'stub'
+    authoritative = False  # Respostas sintéticas não treinam o modelo local
+
+    def __init__(self, latency_ms=50, jitter_ms=0, rate_limit_rate=0.0, error_rate=0.0,
+                 timeout_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.seed = seed
+        # crc32 do prompt → tentativas já feitas; só prompts que ainda falham, e
+        # no máximo STUB_MAX_TRACKED_PROMPTS (o serviço roda por tempo indeterminado)
+        self.attempts = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def generate(self, prompt, image=None, timeout=None):
+        digest = zlib.crc32(prompt.encode('utf-8'))
+        with self.lock:
+            self.calls += 1
+            attempt = self.attempts.pop(digest, 0)
+            self.attempts[digest] = attempt + 1
+            if len(self.attempts) > STUB_MAX_TRACKED_PROMPTS:
+                self.attempts.popitem(last=False)
+        draw = random.Random(f"{self.seed}:{digest}:{attempt}")
+        latency = max(0.0, self.latency_ms + draw.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        roll = draw.random()
+        
+        if roll < self.timeout_rate or (timeout and latency > timeout):
+            time.sleep(min(latency, timeout or latency))
+            raise TimeoutError("stub: timeout simulado")
+        time.sleep(latency)
+        roll -= self.timeout_rate
+        if roll < self.rate_limit_rate:
+            raise TooManyRequests("HTTP 429: stub: cota simulada")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise ServiceUnavailable("HTTP 503: stub: indisponibilidade simulada")
+        with self.lock:
+            self.attempts.pop(digest, None)  # Respondido: a próxima chamada igual recomeça do zero
+        return self.respond(prompt)
+
+    def respond(self, prompt):
+        body = prompt.split("RESPOSTA FORMATO EXATO")[0]
+        blocks = STUB_DOC_PATTERN.split(body)
+        if len(blocks) > 1:
+            answers = []
+            for number, text in zip(blocks[1::2], blocks[2::2]):
+                category, name = self._decide(text)
+                answers.append(f"DOC: {number}\nCATEGORIA: {category}\nNOME: {name}")
+            return "\n\n".join(answers)
+        category, name = self._decide(body.split(CLASSIFICATION_RULES)[0])
+        return f"CATEGORIA: {category}\nNOME: {name}"
+
+    @staticmethod
+    def _decide(text):
+        match = STUB_FILENAME_PATTERN.search(text)
+        filename = match.group(1).strip() if match else "documento"
+        content = text.split("CONTEÚDO:", 1)[1].strip() if "CONTEÚDO:" in text else ""
+        name = derive_name_from_content(content) or Path(filename).stem.replace('_', ' ')
+        return classify_keywords(filename, content), name
+
+
+CLASSIFIER_BACKENDS = {backend.name: backend for backend in (GeminiBackend, OpenAICompatibleBackend,
+                                                             StubBackend)}
+
+
+# =============== LOG EM ARQUIVO ===============
+# A tela mostra só as últimas linhas; o histórico completo vai para um
+# JSON-lines rotativo, gravado por uma thread própria (QueueListener)
+DEFAULT_LOG_FILE = os.path.join("logs", "omnifile.jsonl")
+DEFAULT_LOG_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 5
+DEFAULT_LOG_VIEW_LINES = 2000
+LOG_SEARCH_LIMIT = 500
+LOG_LEVELS = ('INFO', 'WARNING', 'ERROR')
+
+
+def log_level(message):
+    """Nível do registro a partir do emoji da mensagem (❌ erro, ⚠️ aviso)"""
+    text = message.lstrip()
+    if text.startswith('❌'):
+        return logging.ERROR
+    if text.startswith('⚠'):
+        return logging.WARNING
+    return logging.INFO
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Uma linha JSON por registro: ts, nivel, thread, msg"""
+    
+    def format(self, record):
+        return json.dumps({
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }, ensure_ascii=False)
+
+
+def start_file_log(path, max_bytes=DEFAULT_LOG_MAX_BYTES, backups=DEFAULT_LOG_BACKUPS):
+    """Logger cujo log() só enfileira; o QueueListener grava e rotaciona em segundo plano"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                   encoding='utf-8', delay=True)
+    handler.setFormatter(JsonLineFormatter())
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    
+    logger = logging.getLogger('omnifile')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    return logger, listener
+
+
+def log_files(path, backups=DEFAULT_LOG_BACKUPS):
+    """Arquivos do log do mais antigo (path.N) ao atual (path), só os que existem"""
+    names = [f"{path}.{index}" for index in range(backups, 0, -1)] + [path]
+    return [name for name in names if os.path.exists(name)]
+
+
+def search_log(path, text="", level=None, backups=DEFAULT_LOG_BACKUPS, limit=LOG_SEARCH_LIMIT):
+    """Últimos `limit` registros que contêm `text` (sem acento/caixa) e têm o nível pedido.
+    
+    Lê os arquivos linha a linha; só os resultados ficam em memória.
+    """
+    needle = fold_text(text.strip())
+    found = collections.deque(maxlen=limit)
+    for name in log_files(path, backups):
+        with open(name, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if needle and needle not in fold_text(line):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if level and record.get('nivel') != level:
+                    continue
+                if needle and needle not in fold_text(record.get('msg', '')):
+                    continue
+                found.append(record)
+    return list(found)
+
+
+# =============== ORGANIZADOR ===============
+# O motor não depende de interface: a janela (FileOrganizer) e a linha de
+# comando (HeadlessOrganizer) só trocam os ganchos de log/progresso/avisos
+DEFAULT_CONFIG_FILE = "organizer_config.json"
+
+
+class Setting:
+    """Valor com get/set no lugar de tk.StringVar quando não há interface"""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class OrganizerEngine:
+    def __init__(self, config_file=DEFAULT_CONFIG_FILE):
+        self.input_folder = self.make_setting("")
+        self.output_folder = self.make_setting("")
+        self.output_mode = self.make_setting(DEFAULT_OUTPUT_MODE)
+        
+        self.gemini_api_key = ""
+        self.model = None  # ClassifierBackend em uso
+        self.model_name = DEFAULT_MODEL_NAME
+        self.classifier_backend = DEFAULT_CLASSIFIER_BACKEND
+        self.backend_options = {}  # backend → opções (sobre DEFAULT_BACKEND_OPTIONS)
+        self.config_file = config_file
+        
+        # Cache persistente de classificações (reexecuções não chamam a API de novo)
+        self.cache_file = DEFAULT_CACHE_FILE
+        self.cache_max_entries = DEFAULT_CACHE_MAX_ENTRIES
+        self.cache = None
+        
+        # Contadores da execução atual (cache, modelo local); cada tarefa do serviço tem os seus
+        self.run_stats = {}
+        self._stats_lock = threading.Lock()
+        
+        # Modelo local: responde sem a IA quando está confiante (requer NumPy)
+        self.local_model_enabled = True
+        self.local_model_file = DEFAULT_LOCAL_MODEL_FILE
+        self.local_model_threshold = DEFAULT_LOCAL_MODEL_THRESHOLD
+        self.local_audit_rate = DEFAULT_LOCAL_AUDIT_RATE
+        self.local_model = None
+        
+        # Quase-duplicatas: índice MinHash/LSH da execução atual (por pasta de destino)
+        self.near_duplicates_enabled = True
+        self.near_duplicate_threshold = DEFAULT_NEAR_DUPLICATE_THRESHOLD
+        self.near_index = None
+        
+        # Extração em processos separados, com timeout e teto de memória por arquivo
+        self.extraction_processes = DEFAULT_EXTRACTION_PROCESSES
+        self.extraction_timeout = DEFAULT_EXTRACTION_TIMEOUT
+        self.extraction_max_memory_mb = DEFAULT_EXTRACTION_MAX_MEMORY_MB
+        self.extraction_pool = None
+        self.content_budget = DEFAULT_CONTENT_BUDGET
+        self.text_sample_tail = True  # Amostra também o final de arquivos de texto grandes
+        self.image_max_side = DEFAULT_IMAGE_MAX_SIDE
+        self.image_quality = DEFAULT_IMAGE_QUALITY
+        # Backend de PDF: 'auto' escolhe pelo micro-benchmark e grava a escolha
+        self.pdf_backend = DEFAULT_PDF_BACKEND
+        self.pdf_backend_selected = None
+        self.pdf_backend_benchmark = {}
+        
+        # Descoberta: threads de varredura, padrões de exclusão e filtros de tamanho
+        self.scan_workers = DEFAULT_SCAN_WORKERS
+        self.exclude_patterns = list(DEFAULT_EXCLUDE_PATTERNS)
+        self.include_patterns = []
+        self.extensions = None  # None = SUPPORTED_EXTENSIONS
+        self.min_file_size = 0
+        self.max_file_size = None
+        
+        # Duplicatas exatas: apenas um arquivo por grupo é classificado
+        self.duplicates_mode = DEFAULT_DUPLICATES_MODE
+        self.hash_workers = DEFAULT_HASH_WORKERS
+        
+        # Concorrência do pipeline (configurável em organizer_config.json)
+        self.stage_workers = dict(DEFAULT_STAGE_WORKERS)
+        self.queue_size = DEFAULT_QUEUE_SIZE
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.batch_token_budget = DEFAULT_BATCH_TOKEN_BUDGET
+        self._log_lock = threading.Lock()
+        
+        # Log: histórico completo em JSON-lines rotativo (a tela mostra só as últimas linhas)
+        self.log_view_lines = DEFAULT_LOG_VIEW_LINES
+        self.log_file = DEFAULT_LOG_FILE
+        self.log_max_bytes = DEFAULT_LOG_MAX_BYTES
+        self.log_backups = DEFAULT_LOG_BACKUPS
+        self.file_logger = None
+        self.log_listener = None
+        
+        # Limites de taxa das chamadas à IA (compartilhados por todos os workers)
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        self.rate_limiter = RateLimiter(self.rate_limits, self.log)
+        
+        self.load_config()
+        self.start_file_log()
+    
+    def load_config(self):
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+                    self.gemini_api_key = config.get('api_key', '')
+                    self.stage_workers.update(config.get('stage_workers', {}))
+                    self.queue_size = config.get('queue_size', self.queue_size)
+                    self.batch_size = config.get('batch_size', self.batch_size)
+                    self.batch_token_budget = config.get('batch_token_budget', self.batch_token_budget)
+                    self.cache_max_entries = config.get('cache_max_entries', self.cache_max_entries)
+                    self.duplicates_mode = config.get('duplicates_mode', self.duplicates_mode)
+                    self.scan_workers = config.get('scan_workers', self.scan_workers)
+                    self.extraction_processes = config.get('extraction_processes', self.extraction_processes)
+                    self.extraction_timeout = config.get('extraction_timeout', self.extraction_timeout)
+                    self.extraction_max_memory_mb = config.get('extraction_max_memory_mb',
+                                                               self.extraction_max_memory_mb)
+                    self.content_budget = config.get('content_budget', self.content_budget)
+                    self.text_sample_tail = config.get('text_sample_tail', self.text_sample_tail)
+                    self.image_max_side = config.get('image_max_side', self.image_max_side)
+                    self.image_quality = config.get('image_quality', self.image_quality)
+                    self.pdf_backend = config.get('pdf_backend', self.pdf_backend)
+                    self.local_model_enabled = config.get('local_model_enabled', self.local_model_enabled)
+                    self.local_model_threshold = config.get('local_model_threshold', self.local_model_threshold)
+                    self.local_audit_rate = config.get('local_audit_rate', self.local_audit_rate)
+                    self.near_duplicates_enabled = config.get('near_duplicates_enabled',
+                                                              self.near_duplicates_enabled)
+                    self.near_duplicate_threshold = config.get('near_duplicate_threshold',
+                                                               self.near_duplicate_threshold)
+                    self.pdf_backend_selected = config.get('pdf_backend_selected', self.pdf_backend_selected)
+                    self.pdf_backend_benchmark = config.get('pdf_backend_benchmark', self.pdf_backend_benchmark)
+                    self.exclude_patterns = config.get('exclude_patterns', self.exclude_patterns)
+                    self.include_patterns = config.get('include_patterns', self.include_patterns)
+                    self.extensions = config.get('extensions', self.extensions)
+                    self.min_file_size = config.get('min_file_size', self.min_file_size)
+                    self.max_file_size = config.get('max_file_size', self.max_file_size)
+                    self.output_mode.set(config.get('output_mode', self.output_mode.get()))
+                    self.hash_workers = config.get('hash_workers', self.hash_workers)
+                    self.rate_limits.update(config.get('rate_limits', {}))
+                    self.log_view_lines = config.get('log_view_lines', self.log_view_lines)
+                    self.log_file = config.get('log_file', self.log_file)
+                    self.log_max_bytes = config.get('log_max_bytes', self.log_max_bytes)
+                    self.log_backups = config.get('log_backups', self.log_backups)
+                    self.rate_limiter = RateLimiter(self.rate_limits, self.log)
+                    self.classifier_backend = config.get('classifier_backend', self.classifier_backend)
+                    self.backend_options = config.get('backend_options', self.backend_options)
+                    self.setup_backend()
+        except Exception as e:
+            self.log(f"Erro ao carregar configurações: {str(e)}")
+    
+    def save_config(self):
+        try:
+            config = {
+                'api_key': self.gemini_api_key,
+                'stage_workers': self.stage_workers,
+                'queue_size': self.queue_size,
+                'batch_size': self.batch_size,
+                'batch_token_budget': self.batch_token_budget,
+                'cache_max_entries': self.cache_max_entries,
+                'duplicates_mode': self.duplicates_mode,
+                'scan_workers': self.scan_workers,
+                'extraction_processes': self.extraction_processes,
+                'extraction_timeout': self.extraction_timeout,
+                'extraction_max_memory_mb': self.extraction_max_memory_mb,
+                'content_budget': self.content_budget,
+                'text_sample_tail': self.text_sample_tail,
+                'image_max_side': self.image_max_side,
+                'image_quality': self.image_quality,
+                'pdf_backend': self.pdf_backend,
+                'local_model_enabled': self.local_model_enabled,
+                'local_model_threshold': self.local_model_threshold,
+                'local_audit_rate': self.local_audit_rate,
+                'near_duplicates_enabled': self.near_duplicates_enabled,
+                'near_duplicate_threshold': self.near_duplicate_threshold,
+                'pdf_backend_selected': self.pdf_backend_selected,
+                'pdf_backend_benchmark': self.pdf_backend_benchmark,
+                'exclude_patterns': self.exclude_patterns,
+                'include_patterns': self.include_patterns,
+                'extensions': self.extensions,
+                'min_file_size': self.min_file_size,
+                'max_file_size': self.max_file_size,
+                'output_mode': self.output_mode.get(),
+                'hash_workers': self.hash_workers,
+                'rate_limits': self.rate_limits,
+                'log_view_lines': self.log_view_lines,
+                'log_file': self.log_file,
+                'log_max_bytes': self.log_max_bytes,
+                'log_backups': self.log_backups,
+                'classifier_backend': self.classifier_backend,
+                'backend_options': self.backend_options,
+            }
+            with open(self.config_file, 'w') as f:
+                json.dump(config, f)
+        except Exception as e:
+            self.log(f"Erro ao salvar configurações: {str(e)}")
+    
+    def update_config(self, **values):
+        """Grava só estas chaves no arquivo de configuração, mantendo as demais.
+        
+        Serve para valores medidos (como o backend de PDF escolhido pelo
+        benchmark), que valem em qualquer modo; save_config grava as escolhas
+        do usuário e não roda na linha de comando nem nas tarefas do serviço.
+        """
+        try:
+            config = {}
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+            config.update(values)
+            partial_path = self.config_file + ".parcial"
+            with open(partial_path, 'w') as f:
+                json.dump(config, f)
+            os.replace(partial_path, self.config_file)
+        except Exception as e:
+            self.log(f"Erro ao salvar configurações: {str(e)}")
+    
+    def setup_backend(self):
+        """Cria o backend de classificação configurado; False se faltar a chave do Gemini ou der erro"""
+        name = self.classifier_backend
+        try:
+            if name == GeminiBackend.name:
+                if not self.gemini_api_key:
+                    return False
+                backend = GeminiBackend(self.gemini_api_key, self.model_name)
+            else:
+                if name not in CLASSIFIER_BACKENDS:
+                    raise ValueError(f"backend desconhecido '{name}' (use {', '.join(CLASSIFIER_BACKENDS)})")
+                options = dict(DEFAULT_BACKEND_OPTIONS.get(name, {}))
+                options.update(self.backend_options.get(name, {}))
+                backend = CLASSIFIER_BACKENDS[name](**options)
+        except Exception as e:
+            self.notify('showerror', "Erro", f"Erro ao configurar o backend {name}: {str(e)}")
+            return False
+        if self.model is not None:
+            self.model.close()
+        self.model = backend
+        return True
+    
+    def extract_content(self, file_path):
+        """Extrai (texto, imagem) do arquivo (no pool de processos, se habilitado)"""
+        pool = self.get_extraction_pool()
+        return pool.extract(file_path) if pool else extract_document(file_path, **self.extraction_options())
+    
+    def extraction_options(self):
+        return {'budget': self.content_budget, 'sample_tail': self.text_sample_tail,
+                'image_max_side': self.image_max_side, 'image_quality': self.image_quality,
+                'pdf_backend': self.pdf_backend_selected or PyPDF2Backend.name}
+    
+    def select_pdf_backend(self):
+        """Define o backend de PDF: o configurado ou, em 'auto', o mais rápido no micro-benchmark"""
+        available = available_pdf_backends()
+        if self.pdf_backend != 'auto':
+            self.pdf_backend_selected = _pdf_backend(self.pdf_backend).name
+            if self.pdf_backend_selected != self.pdf_backend:
+                self.log(f"⚠️ Backend de PDF '{self.pdf_backend}' indisponível, usando {self.pdf_backend_selected}")
+            return self.pdf_backend_selected
+        
+        # A escolha gravada vale enquanto os mesmos backends estiverem instalados
+        if self.pdf_backend_selected in available and sorted(self.pdf_backend_benchmark) == sorted(available):
+            return self.pdf_backend_selected
+        
+        self.pdf_backend_benchmark = benchmark_pdf_backends()
+        working = {name: ms for name, ms in self.pdf_backend_benchmark.items() if ms is not None}
+        if working:
+            self.pdf_backend_selected = min(working, key=working.get)
+        else:
+            self.pdf_backend_selected = _pdf_backend(PyPDF2Backend.name).name
+        timings = ", ".join([f"{name} {ms:.1f} ms" for name, ms in sorted(working.items(), key=lambda item: item[1])]
+                            + [f"{name} falhou" for name, ms in self.pdf_backend_benchmark.items() if ms is None])
+        self.log(f"⚡ Backend de PDF: {self.pdf_backend_selected} ({timings})")
+        self.update_config(pdf_backend_selected=self.pdf_backend_selected,
+                           pdf_backend_benchmark=self.pdf_backend_benchmark)
+        return self.pdf_backend_selected
+    
+    def get_extraction_pool(self):
+        """Pool de processos de extração, criado no primeiro uso e mantido aquecido"""
+        if self.extraction_processes <= 0:
+            return None
+        with self._log_lock:
+            if self.extraction_pool is None:
+                self.extraction_pool = ExtractionPool(self.extraction_processes,
+                                                      self.extraction_timeout,
+                                                      self.extraction_max_memory_mb,
+                                                      self.extraction_options())
+        return self.extraction_pool
+    
+    def build_prompt(self, content, filename):
+        """Prompt de classificação de um único documento"""
+        return f"""
+Analise este documento e classifique em uma das categorias EXATAS abaixo:
+
+{CATEGORY_LIST}
+
+NOME ORIGINAL: {filename}
+CONTEÚDO: {content[:PROMPT_CONTENT_CHARS]}
+
+{CLASSIFICATION_RULES}
+
+RESPOSTA FORMATO EXATO:
+CATEGORIA: [uma das categorias acima]
+NOME: [nome específico e descritivo sobre o conteúdo]
+"""
+    
+    def build_batch_prompt(self, documents):
+        """Prompt de classificação de vários documentos (lista de (conteúdo, nome))"""
+        blocks = []
+        for index, (content, filename) in enumerate(documents, 1):
+            blocks.append(f"=== DOC {index} ===\n"
+                          f"NOME ORIGINAL: {filename}\n"
+                          f"CONTEÚDO: {content[:PROMPT_CONTENT_CHARS]}")
+        documents_text = "\n\n".join(blocks)
+        
+        return f"""
+Analise os {len(documents)} documentos abaixo e classifique CADA UM em uma das categorias EXATAS:
+
+{CATEGORY_LIST}
+
+{CLASSIFICATION_RULES}
+
+DOCUMENTOS:
+{documents_text}
+
+RESPOSTA FORMATO EXATO (um bloco por documento, todos os {len(documents)}, na mesma ordem):
+DOC: [número do documento]
+CATEGORIA: [uma das categorias acima]
+NOME: [nome específico e descritivo sobre o conteúdo]
+"""
+    
+    def build_image_prompt(self, filename):
+        """Prompt de classificação de uma imagem (documento digitalizado ou foto)"""
+        return f"""
+Analise a imagem anexa (documento digitalizado, foto ou recibo) e classifique em uma das categorias EXATAS abaixo:
+
+{CATEGORY_LIST}
+
+NOME ORIGINAL: {filename}
+
+{CLASSIFICATION_RULES}
+
+RESPOSTA FORMATO EXATO:
+CATEGORIA: [uma das categorias acima]
+NOME: [nome específico e descritivo sobre o conteúdo da imagem]
+"""
+    
+    def generate(self, prompt, image=None):
+        """Chama o modelo respeitando os limites de taxa; retorna o texto da resposta"""
+        tokens = self.rate_limiter.estimate_tokens(prompt)
+        if image is not None:
+            tokens += IMAGE_TOKENS
+        backend = self.model
+        return self.rate_limiter.call(lambda timeout: backend.generate(prompt, image, timeout), tokens=tokens)
+    
+    def open_cache(self):
+        """Abre o cache de classificações (uma vez por sessão)"""
+        if self.cache is None:
+            try:
+                self.cache = ClassificationCache(self.cache_file, self.cache_max_entries)
+            except Exception as e:
+                self.log(f"⚠️ Cache indisponível: {str(e)}")
+        return self.cache
+    
+    def clear_cache(self):
+        """Invalida todas as classificações guardadas"""
+        cache = self.open_cache()
+        if cache:
+            cache.invalidate()
+            self.notify('showinfo', "Cache", "Cache de classificações apagado!")
+    
+    def open_local_model(self):
+        """Modelo local de pré-classificação (None sem NumPy ou se desativado)"""
+        if not self.local_model_enabled or np is None:
+            return None
+        error = None
+        with self._log_lock:
+            if self.local_model is None:
+                try:
+                    self.local_model = LocalClassifier(self.local_model_file)
+                except Exception as e:
+                    self.local_model_enabled = False
+                    error = e
+        if error is not None:
+            self.log(f"⚠️ Modelo local indisponível: {str(error)}")
+        return self.local_model
+    
+    def classify_locally(self, content, filename):
+        """Resultado do modelo local quando ele está confiante; None = consultar a IA"""
+        model = self.open_local_model()
+        if model is None:
+            return None
+        category, confidence = model.predict(content, filename)
+        if category is None or confidence < self.local_model_threshold:
+            return None
+        if random.random() < self.local_audit_rate:
+            return None  # Uma amostra vai à IA mesmo assim, para a avaliação seguir medindo
+        # O nome sai de uma linha própria do documento, não do timbre comum a todos;
+        # sem uma linha assim, a IA classifica e nomeia
+        name = derive_name_from_content(content, exclude=model.template_lines(content))
+        if not name:
+            return None
+        model.record_saved()
+        self.count('local_answers')
+        return {'category': category, 'name': self.validate_filename(name, filename)}
+    
+    def learn_locally(self, content, filename, result):
+        """Treina o modelo local com uma decisão do Gemini"""
+        model = self.open_local_model()
+        if model is not None:
+            model.learn(content, filename, result['category'], self.local_model_threshold)
+    
+    def remember_ai_decision(self, content, filename, result):
+        """Guarda uma decisão nova do Gemini no modelo local e no índice de quase-duplicatas"""
+        if not self.model.authoritative:
+            return
+        self.learn_locally(content, filename, result)
+        index = self.near_index
+        if index is not None:
+            signature = minhash_signature(content)
+            if signature is not None:
+                index.add(signature, result['category'], content_lines(content))
+    
+    def reuse_near_duplicate(self, content, filename):
+        """Categoria de um vizinho quase idêntico já classificado.
+        
+        O nome vem de uma linha que o vizinho não tem (o cabeçalho do modelo é
+        comum a todos); sem uma linha assim, None: a IA classifica e nomeia.
+        """
+        index = self.near_index
+        if index is None:
+            return None
+        signature = minhash_signature(content)
+        if signature is None:
+            return None
+        category, similarity, shared_lines = index.lookup(signature)
+        if category is None or shared_lines is None:
+            return None
+        name = derive_name_from_content(content, exclude=shared_lines)
+        if not name:
+            return None
+        index.record_reuse()
+        self.log(f"   ♻️ Quase-duplicata ({similarity:.0%}): {category}")
+        return {'category': category, 'name': self.validate_filename(name, filename)}
+    
+    def count(self, stat, amount=1):
+        """Soma em run_stats (chamado por vários workers)"""
+        with self._stats_lock:
+            self.run_stats[stat] = self.run_stats.get(stat, 0) + amount
+    
+    def cache_lookup(self, content, filename):
+        if self.cache is None:
+            return None, None
+        key = ClassificationCache.make_key(content, filename, self.model.model_id)
+        cached = self.cache.get(key)
+        self.count('cache_hits' if cached else 'cache_misses')
+        return key, cached
+    
+    def cache_store(self, key, result):
+        if self.cache is not None and key is not None:
+            try:
+                self.cache.put(key, result)
+            except Exception as e:
+                self.log(f"⚠️ Erro ao gravar cache: {str(e)}")
+    
+    def analyze_with_gemini(self, content, filename):
+        """Análise inteligente com categorização específica"""
+        key, cached = self.cache_lookup(content, filename)
+        if cached:
+            return cached
+        return self._analyze_single(content, filename, key)
+    
+    def _analyze_single(self, content, filename, key):
+        try:
+            prompt = self.build_prompt(content, filename)
+            result, recognized = self.parse_response(self.generate(prompt), filename)
+            if recognized:
+                self.cache_store(key, result)
+                self.remember_ai_decision(content, filename, result)
+            else:
+                self.log(f"⚠️ Resposta da IA sem categoria válida para {filename}")
+            return result
+            
+        except Exception as e:
+            self.log(f"⚠️ Erro IA para {filename}: {str(e)}")
+            return self.fallback_analysis(filename, content)
+    
+    def _analyze_batch(self, documents):
+        """Classifica vários documentos (lista de (conteúdo, nome, chave do cache)) numa só requisição.
+        
+        Se a resposta vier malformada, os documentos sem resposta válida são
+        reenviados em lotes menores (divididos ao meio) em vez de irem para o fallback.
+        """
+        if len(documents) == 1:
+            return [self._analyze_single(*documents[0])]
+        
+        try:
+            response_text = self.generate(self.build_batch_prompt([doc[:2] for doc in documents]))
+        except Exception as e:
+            # A requisição falhou mesmo após as tentativas: dividir não ajudaria
+            self.log(f"⚠️ Erro IA no lote de {len(documents)} arquivos: {str(e)}")
+            return [self.fallback_analysis(filename, content) for content, filename, _ in documents]
+        
+        results = self.parse_batch_response(response_text, documents)
+        missing = []
+        for i, result in enumerate(results):
+            if result is None:
+                missing.append(i)
+            else:
+                self.cache_store(documents[i][2], result)
+                self.remember_ai_decision(documents[i][0], documents[i][1], result)
+        if not missing:
+            return results
+        
+        retry = [documents[i] for i in missing]
+        if len(retry) == len(documents):
+            middle = len(retry) // 2
+            retried = self._analyze_batch(retry[:middle]) + self._analyze_batch(retry[middle:])
+        else:
+            retried = self._analyze_batch(retry)
+        
+        for i, result in zip(missing, retried):
+            results[i] = result
+        return results
+    
+    def parse_batch_response(self, response_text, documents):
+        """Separa a resposta por documento; None para documentos sem resposta válida"""
+        blocks = {}
+        current = None
+        for line in response_text.strip().split('\n'):
+            match = BATCH_DOC_PATTERN.match(line)
+            if match:
+                current = int(match.group(1))
+                blocks[current] = []
+            elif current is not None:
+                blocks[current].append(line.strip())
+        
+        results = []
+        for index, document in enumerate(documents, 1):
+            filename = document[1]
+            lines = blocks.get(index, [])
+            result, recognized = self.parse_response('\n'.join(lines), filename)
+            results.append(result if recognized else None)
+        return results
+    
+    def parse_response(self, response_text, filename):
+        """Extrai categoria e nome da resposta.
+        
+        Retorna (resultado, reconhecida). reconhecida é False se a resposta não
+        trouxe uma das CATEGORIES: o resultado ainda serve para este arquivo
+        (categoria pelas palavras-chave do nome), mas não vai para o cache nem
+        treina o modelo local e o índice de quase-duplicatas.
+        """
+        try:
+            fields = answer_fields(response_text)
+            category = CATEGORY_KEYS.get(category_key(fields.get('CATEGORIA', '')))
+            recognized = category is not None
+            if not recognized:
+                category = classify_keywords(filename)
+            
+            # Valida se o nome não é genérico demais
+            name = self.validate_filename(fields.get('NOME') or Path(filename).stem, filename)
+            
+            return {'category': category, 'name': name[:70]}, recognized
+        except Exception:
+            return self.fallback_analysis(filename), False
+    
+    def validate_filename(self, proposed_name, original_filename):
+        """Valida e melhora nomes genéricos"""
+        proposed_lower = proposed_name.lower().strip()
+        
+        # Lista de nomes genéricos para evitar
+        generic_names = [
+            'documento', 'arquivo', 'file', 'doc', 'pdf', 'texto',
+            'untitled', 'sem titulo', 'novo', 'copia', 'copy'
+        ]
+        
+        # Verifica se é só data (regex para formatos de data)
+        date_patterns = [
+            r'^\d{4}-\d{2}-\d{2}$',  # 2024-01-15
+            r'^\d{2}/\d{2}/\d{4}$',  # 15/01/2024
+            r'^\d{2}-\d{2}-\d{4}$',  # 15-01-2024
+            r'^\d{8}$',              # 20240115
+        ]
+        
+        is_generic = any(generic in proposed_lower for generic in generic_names)
+        is_only_date = any(re.match(pattern, proposed_lower) for pattern in date_patterns)
+        is_too_short = len(proposed_lower.replace(' ', '')) < 3
+        
+        if is_generic or is_only_date or is_too_short:
+            # Tenta extrair algo melhor do nome original
+            original_clean = Path(original_filename).stem.replace('_', ' ').replace('-', ' ')
+            if len(original_clean) > 5:
+                return f"Documento - {original_clean}"
+            else:
+                return f"Documento - {original_filename}"
+        
+        return proposed_name
+    
+    def fallback_analysis(self, filename, content=""):
+        """Análise básica sem IA: palavras-chave no nome e no conteúdo"""
+        name = Path(filename).stem.replace('_', ' ').replace('-', ' ')
+        category = classify_keywords(filename, content)
+        
+        # Melhora o nome baseado na categoria
+        improved_name = self.improve_name_by_category(name, category, filename)
+        
+        return {'category': category, 'name': improved_name}
+    
+    def improve_name_by_category(self, name, category, filename):
+        """Melhora o nome baseado na categoria identificada"""
+        # Se o nome é muito genérico, melhora baseado na categoria
+        if len(name.strip()) < 5 or name.lower() in ['documento', 'arquivo', 'file']:
+            category_prefixes = {
+                "Oficios_e_Pareceres": "Ofício",
+                "Processos_Judiciais": "Processo",
+                "Ouvidoria_e_Reclamacoes": "Ouvidoria",
+                "Relatorios_e_Analises": "Relatório",
+                "Contratos_e_Acordos": "Contrato",
+                "Leis_e_Normativas": "Normativa",
+                "Deliberacoes_e_Resolucoes": "Deliberação",
+                "Documentos_Pessoais": "Documento Pessoal",
+                "Financeiro_e_Pagamentos": "Financeiro",
+                "Correspondencias_Gerais": "Correspondência",
+                "Outros_Documentos": "Documento"
+            }
+            prefix = category_prefixes.get(category, "Documento")
+            
+            # Tenta extrair data do nome original
+            date_match = re.search(r'(\d{4}[-_]\d{2}[-_]\d{2}|\d{2}[-_]\d{2}[-_]\d{4})', filename)
+            if date_match:
+                return f"{prefix} - {date_match.group(1)}"
+            else:
+                return f"{prefix} - {Path(filename).stem}"
+        
+        # Valida o nome proposto
+        return self.validate_filename(name, filename)
+    
+    def sanitize_filename(self, filename):
+        """Limpa nome do arquivo"""
+        invalid_chars = '<>:"/\\|?*'
+        for char in invalid_chars:
+            filename = filename.replace(char, ' ')
+        
+        # Remove espaços extras e limita tamanho
+        filename = ' '.join(filename.split())  # Remove espaços duplos
+        return filename.strip()[:70] or "Documento"
+    
+    def analyze_image_with_gemini(self, image, image_hash, filename):
+        """Classificação multimodal; o cache é indexado pelo hash da imagem, não pelo nome. None se falhar"""
+        key, cached = self.cache_lookup(f"imagem:{image_hash}", "")
+        if cached:
+            return cached
+        try:
+            result, recognized = self.parse_response(self.generate(self.build_image_prompt(filename), image),
+                                                     filename)
+            if recognized:
+                self.cache_store(key, result)
+            else:
+                self.log(f"⚠️ Resposta da IA sem categoria válida para {filename}")
+            return result
+        except Exception as e:
+            self.log(f"⚠️ Erro IA para {filename}: {str(e)}")
+            return None
+    
+    def classify_image(self, job, run):
+        """Classifica a imagem do job; cópias idênticas esperam e reaproveitam o resultado"""
+        image, image_hash = job.image
+        with run.image_lock:
+            entry = run.image_results.get(image_hash)
+            owner = entry is None
+            if owner:
+                entry = run.image_results[image_hash] = {'done': threading.Event(), 'result': None}
+        
+        if owner:
+            try:
+                entry['result'] = self.analyze_image_with_gemini(image, image_hash, job.filename)
+            finally:
+                entry['done'].set()
+        else:
+            entry['done'].wait()
+            if entry['result'] is not None:
+                with run.image_lock:
+                    run.images_reused += 1
+        
+        return dict(entry['result']) if entry['result'] else self.fallback_analysis(job.filename)
+    
+    def classify_content(self, content, filename):
+        """Classifica pelo conteúdo com IA ou, se não houver texto suficiente, pelo nome.
+        
+        O cache vem antes de tudo: o mesmo arquivo repete a decisão já tomada pela
+        IA; só depois entram a quase-duplicata e o modelo local.
+        """
+        if content and len(content.strip()) > 50:
+            key, cached = self.cache_lookup(content, filename)
+            return (cached or self.reuse_near_duplicate(content, filename)
+                    or self.classify_locally(content, filename)
+                    or self._analyze_single(content, filename, key))
+        return self.fallback_analysis(filename, content)
+    
+    def resolve_destination(self, job, run):
+        """Define pasta e nome final; o índice de destinos evita duplicatas"""
+        category = job.result['category']
+        new_name = self.sanitize_filename(job.result['name'])
+        extension = Path(job.path).suffix
+        
+        job.final_name = run.index.reserve(category, new_name, extension)
+        job.final_path = os.path.join(run.output_path, category, job.final_name)
+    
+    # Estágios do pipeline: cada um ignora jobs que já falharam e registra o erro no job
+    
+    def _stage_hash(self, job, detector):
+        if job.active:
+            job.duplicate_of = detector.check(job)
+        return job
+    
+    def _stage_extract(self, job, run):
+        if job.active:
+            self.log(f"🔍 {job.filename}")
+            try:
+                job.content, job.image = self.extract_content(job.path)
+                if job.image is not None and job.filename.lower().endswith('.pdf'):
+                    self.log("   🖼️ PDF sem texto: classificando pela imagem da 1ª página")
+            except Exception as e:
+                # Sem conteúdo o arquivo ainda é classificado pelo nome; a falha vai para o relatório
+                if not isinstance(e, ExtractionError):
+                    e = ExtractionError('falha', f"{type(e).__name__}: {str(e)}")
+                self.log(f"   ⚠️ Extração falhou ({e.kind}): {e.detail}")
+                run.extraction_errors.append({'arquivo': job.path, 'tipo': e.kind, 'detalhe': e.detail})
+                job.content = ""
+        return job
+    
+    def _stage_classify(self, job, run):
+        if job.active:
+            try:
+                if job.image is not None:
+                    job.result = self.classify_image(job, run)
+                else:
+                    job.result = self.classify_content(job.content, job.filename)
+            except Exception as e:
+                job.error = e
+        return job
+    
+    def _stage_classify_batch(self, jobs, run):
+        """Classificação em lote: documentos com conteúdo vão juntos numa requisição
+        (na mesma ordem de classify_content: cache, quase-duplicata, modelo local, IA)"""
+        batch = []
+        for job in jobs:
+            if not job.active:
+                continue
+            if job.image is not None:
+                self._stage_classify(job, run)  # Imagens vão uma por requisição
+            elif job.content and len(job.content.strip()) > 50:
+                key, cached = self.cache_lookup(job.content, job.filename)
+                job.result = (cached or self.reuse_near_duplicate(job.content, job.filename)
+                              or self.classify_locally(job.content, job.filename))
+                if job.result is None:
+                    batch.append((job, key))
+            else:
+                job.result = self.fallback_analysis(job.filename, job.content)
+        
+        if batch:
+            try:
+                results = self._analyze_batch([(job.content, job.filename, key) for job, key in batch])
+                for (job, _), result in zip(batch, results):
+                    job.result = result
+            except Exception as e:
+                for job, _ in batch:
+                    job.error = e
+        return jobs
+    
+    def _batch_cost(self, job):
+        """Tokens estimados que o documento ocupa num prompt em lote"""
+        return self.rate_limiter.estimate_tokens(job.content[:PROMPT_CONTENT_CHARS] + job.filename)
+    
+    def _stage_name(self, job, run):
+        if job.active:
+            try:
+                self.resolve_destination(job, run)
+            except Exception as e:
+                job.error = e
+        return job
+    
+    def place_job(self, job, run, src=None):
+        """Materializa src (padrão: a origem do job) em job.final_path.
+        
+        O índice de destinos é lido uma vez por execução: se o nome reservado
+        foi ocupado depois disso, reserva o próximo livre e tenta de novo.
+        """
+        while True:
+            try:
+                return run.materializer.place(src or job.path, job.final_path)
+            except FileExistsError:
+                self.log(f"   ⚠️ {job.final_name} apareceu no destino durante a execução; usando outro nome")
+                self.resolve_destination(job, run)
+    
+    def _stage_copy(self, job, run):
+        if job.active:
+            try:
+                self.place_job(job, run)
+                if run.journal is not None:
+                    run.journal.record(job)
+            except Exception as e:
+                job.error = e
+        job.content = ""  # Libera memória assim que o arquivo sai do pipeline
+        job.image = None
+        return job
+    
+    def _finish_job(self, job):
+        """Registra o resultado de um job concluído"""
+        if job.error is not None:
+            self.log(f"❌ Erro: {job.filename} - {str(job.error)}")
+            return False
+        
+        self.log(f"   → {job.result['category']}/{job.final_name}")
+        return True
+    
+    def _stage_error(self, stage, job, error):
+        """Exceção que escapou de um estágio: vira o erro do arquivo (ou da descoberta)"""
+        detail = f"{type(error).__name__}: {str(error)}"
+        if job is None:
+            self.log(f"❌ Erro na {stage}: {detail}")
+            return
+        self.log(f"⚠️ Falha inesperada no estágio '{stage}' ({job.filename}): {detail}")
+        if job.error is None:
+            job.error = error
+    
+    @staticmethod
+    def pipeline_errors(pipeline):
+        """Exceções que escaparam dos estágios, para o relatório"""
+        return [{'estagio': stage, 'erro': f"{type(error).__name__}: {str(error)}"}
+                for stage, error in pipeline.errors]
+    
+    def build_pipeline(self, run, detector=None, classify_only=False):
+        """Monta o pipeline (hash →) extração → classificação (→ nomeação → cópia)"""
+        workers = self.stage_workers
+        pipeline = StagedPipeline(self.queue_size, on_error=self._stage_error,
+                                  on_stop=detector.cancel if detector is not None else None)
+        if detector is not None:
+            pipeline.add_stage('hash', lambda job: self._stage_hash(job, detector), self.hash_workers)
+        pipeline.add_stage('extracao', lambda job: self._stage_extract(job, run), workers.get('extracao', 1))
+        if self.batch_size > 1:
+            pipeline.add_stage('classificacao', lambda jobs: self._stage_classify_batch(jobs, run),
+                               workers.get('classificacao', 1),
+                               batch_size=self.batch_size, batch_cost=self._batch_cost,
+                               batch_budget=self.batch_token_budget)
+        else:
+            pipeline.add_stage('classificacao', lambda job: self._stage_classify(job, run),
+                               workers.get('classificacao', 1))
+        if classify_only:
+            return pipeline
+        pipeline.add_stage('nomeacao', lambda job: self._stage_name(job, run), ordered=True)
+        pipeline.add_stage('copia', lambda job: self._stage_copy(job, run), workers.get('copia', 1))
+        return pipeline
+    
+    def place_duplicates(self, duplicates, run):
+        """Trata as cópias idênticas depois que o arquivo principal foi organizado.
+        
+        Retorna o relatório [{'original', 'destino', 'duplicatas'}] e quantas
+        duplicatas foram concluídas.
+        """
+        report = []
+        placed = 0
+        for primary, copies in duplicates.items():
+            entry = {'original': primary.path, 'destino': primary.final_path,
+                     'duplicatas': [job.path for job in copies]}
+            report.append(entry)
+            
+            for job in copies:
+                if primary.error is not None or primary.final_path is None:
+                    job.error = primary.error or RuntimeError("arquivo principal não foi organizado")
+                elif self.duplicates_mode == 'skip':
+                    job.result = primary.result
+                    job.final_path = primary.final_path
+                    placed += 1
+                    continue
+                else:
+                    job.result = primary.result
+                    self._place_duplicate(job, primary.final_path, run)
+                
+                if job.error is not None:
+                    self.log(f"❌ Erro: {job.filename} - {str(job.error)}")
+                else:
+                    self.log(f"   ♊ {job.filename} → {job.result['category']}/{job.final_name}")
+                    placed += 1
+        return report, placed
+    
+    def _place_duplicate(self, job, primary_path, run):
+        """Coloca a duplicata pelo modo de saída da execução (em 'move' a origem sai
+        da pasta de entrada); em 'copy', hardlink do arquivo principal já organizado"""
+        try:
+            self.resolve_destination(job, run)
+            if run.materializer.mode == 'copy':
+                self._hardlink_duplicate(job, primary_path, run)
+            else:
+                self.place_job(job, run)
+            if run.journal is not None:
+                run.journal.record(job)
+        except Exception as e:
+            job.error = e
+    
+    def _hardlink_duplicate(self, job, primary_path, run):
+        """Hardlink do arquivo principal; sem suporte no sistema de arquivos, copia"""
+        while True:
+            try:
+                os.link(primary_path, job.final_path)
+                return
+            except FileExistsError:
+                self.resolve_destination(job, run)
+            except OSError as e:
+                if not is_unsupported_error(e):
+                    raise
+                self.place_job(job, run)
+                return
+    
+    def write_report(self, output_base, report):
+        """Grava o relatório da execução em .omnifile/relatorio-<data>[-n].json (nunca sobrescreve)"""
+        try:
+            folder = os.path.join(output_base, WORK_FOLDER)
+            os.makedirs(folder, exist_ok=True)
+            stem = os.path.join(folder, f"relatorio-{datetime.now():%Y%m%d-%H%M%S}")
+            counter = 1
+            while True:
+                path = f"{stem}.json" if counter == 1 else f"{stem}-{counter}.json"
+                try:
+                    f = open(path, 'x', encoding='utf-8')
+                    break
+                except FileExistsError:
+                    counter += 1
+            with f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            return path
+        except Exception as e:
+            self.log(f"⚠️ Erro ao gravar relatório: {str(e)}")
+            return None
+    
+    def process_file(self, file_path, output_base, run=None):
+        """Processa arquivo único (modo sequencial, mesmos estágios do pipeline)"""
+        run = run or RunContext(None, output_base)
+        job = FileJob(file_path)
+        self._stage_extract(job, run)
+        self._stage_classify(job, run)
+        self._stage_name(job, run)
+        self._stage_copy(job, run)
+        return self._finish_job(job)
+    
+    def classify_files(self, paths):
+        """Só classifica (não copia nem move): report_result para cada arquivo.
+        
+        Retorna o resumo {'arquivos', 'classificados', 'erros'}.
+        """
+        run = RunContext(None, None)
+        counts = {'arquivos': len(paths), 'classificados': 0, 'erros': 0}
+        
+        def jobs():
+            for path in paths:
+                if os.path.isfile(path):
+                    yield FileJob(path)
+                else:
+                    counts['erros'] += 1
+                    self.report_result({'arquivo': path, 'status': 'erro', 'erro': "arquivo não encontrado"})
+        
+        def on_done(job):
+            if job.error is None:
+                counts['classificados'] += 1
+            else:
+                counts['erros'] += 1
+            finished = counts['classificados'] + counts['erros']
+            self.post_progress(finished / max(counts['arquivos'], 1) * 100,
+                               f"Classificando {finished}/{counts['arquivos']}")
+            self.report_result(self.result_record(job))
+        
+        pipeline = self.build_pipeline(run, classify_only=True)
+        pipeline.run(jobs(), on_done)
+        counts['erros'] += sum(stage == 'descoberta' for stage, _ in pipeline.errors)
+        return counts
+    
+    def iter_files(self, folder_path, skip_dirs=()):
+        """Descobre arquivos suportados sob demanda, já com tamanho e mtime"""
+        scan_filter = ScanFilter(exclude=self.exclude_patterns, include=self.include_patterns,
+                                 extensions=self.extensions or SUPPORTED_EXTENSIONS,
+                                 min_size=self.min_file_size, max_size=self.max_file_size,
+                                 skip_dirs=skip_dirs)
+        return iter(ParallelScanner(folder_path, scan_filter, self.scan_workers, self.log))
+    
+    def process_files(self, input_path=None, output_path=None, output_mode=None):
+        """Processamento principal.
+        
+        As pastas e o modo vêm dos parâmetros quando informados (a interface os
+        lê na thread principal, já que tk.StringVar não pode ser lido no worker);
+        senão, das configurações.
+        
+        Retorna o relatório da execução (com 'erros' = arquivos que falharam)
+        ou None se a execução não pôde ser concluída.
+        """
+        try:
+            if not self.model:
+                self.notify('showerror', "Erro", "Configure a API do Gemini!")
+                return None
+            
+            if input_path is None:
+                input_path = self.input_folder.get()
+            if output_path is None:
+                output_path = self.output_folder.get()
+            if output_mode is None:
+                output_mode = self.output_mode.get()
+            
+            if not input_path or not output_path:
+                self.notify('showerror', "Erro", "Selecione as pastas!")
+                return None
+            
+            os.makedirs(output_path, exist_ok=True)
+            self.open_cache()
+            self.run_stats = {}
+            self.select_pdf_backend()
+            local_model = self.open_local_model()
+            if self.near_duplicates_enabled:
+                self.near_index = NearDuplicateIndex(output_path, self.near_duplicate_threshold)
+            
+            self.log(f"🚀 Processando arquivos de {input_path}...")
+            
+            journal = ProcessingJournal(output_path, input_path)
+            if journal.resumed:
+                self.log(f"⏩ Retomando execução anterior: {len(journal.completed)} arquivos já concluídos")
+            
+            # A descoberta roda na thread de alimentação do pipeline, em paralelo ao processamento
+            counts = {'discovered': 0, 'skipped': 0, 'discovering': True}
+            
+            def discover():
+                try:
+                    for job in self.iter_files(input_path, skip_dirs=[output_path]):
+                        counts['discovered'] += 1
+                        if journal.is_done(job):
+                            counts['skipped'] += 1
+                            self.report_result(self.result_record(job, 'retomado'))
+                            continue
+                        yield job
+                finally:
+                    counts['discovering'] = False
+            
+            processed = 0
+            failed = 0
+            done = 0
+            duplicates = {}
+            start_time = datetime.now()
+            
+            def on_done(job):
+                nonlocal processed, failed, done
+                done += 1
+                if job.duplicate_of is not None:
+                    duplicates.setdefault(job.duplicate_of, []).append(job)
+                else:
+                    if self._finish_job(job):
+                        processed += 1
+                    else:
+                        failed += 1
+                    self.report_result(self.result_record(job))
+                
+                finished = done + counts['skipped']
+                discovered = max(counts['discovered'], 1)
+                if counts['discovering']:
+                    status = f"Processando {finished}/{counts['discovered']} (descobrindo arquivos...)"
+                else:
+                    status = f"Processando {finished}/{counts['discovered']}"
+                self.post_progress((finished / discovered) * 100, status)
+            
+            materializer = OutputMaterializer(output_mode, input_path, output_path, self.log)
+            if output_mode != 'copy':
+                self.log(f"📦 Modo de saída: {materializer.mode}")
+            run = RunContext(input_path, output_path, journal, materializer)
+            detector = DuplicateDetector(self.log) if self.duplicates_mode in ('link', 'skip') else None
+            try:
+                pipeline = self.build_pipeline(run, detector)
+                pipeline.run(detector.numbered(discover()) if detector else discover(), on_done)
+                # Os erros por arquivo já foram contados em on_done; os da descoberta não têm arquivo
+                failed += sum(stage == 'descoberta' for stage, _ in pipeline.errors)
+                if duplicates:
+                    repeated = sum(len(copies) for copies in duplicates.values())
+                    self.log(f"♊ {repeated} duplicatas exatas em {len(duplicates)} grupos")
+                duplicates_report, duplicates_placed = self.place_duplicates(duplicates, run)
+                for copies in duplicates.values():
+                    for job in copies:
+                        failed += job.error is not None
+                        self.report_result(self.result_record(job))
+            except BaseException:
+                journal.close()  # Mantém o diário aberto para retomar depois
+                raise
+            journal.finish()
+            if local_model is not None:
+                local_model.save()
+            near_reused = self.near_index.reused if self.near_index else 0
+            stats = dict(self.run_stats)
+            
+            total = counts['discovered']
+            if total == 0:
+                self.notify('showinfo', "Info", "Nenhum arquivo encontrado")
+                return {'arquivos': 0, 'organizados': 0, 'erros': failed,
+                        'erros_pipeline': self.pipeline_errors(pipeline)}
+            processed += duplicates_placed + counts['skipped']
+            
+            duration = datetime.now() - start_time
+            report = {
+                'origem': os.path.abspath(input_path),
+                'destino': os.path.abspath(output_path),
+                'inicio': start_time.isoformat(timespec='seconds'),
+                'duracao_s': round(duration.total_seconds(), 1),
+                'arquivos': total,
+                'organizados': processed,
+                'erros': failed,
+                'retomados': counts['skipped'],
+                'modo_saida': materializer.mode,
+                'modo_duplicatas': self.duplicates_mode,
+                'duplicatas': duplicates_report,
+                'erros_extracao': run.extraction_errors,
+                'erros_pipeline': self.pipeline_errors(pipeline),
+                'imagens_reaproveitadas': run.images_reused,
+                'quase_duplicatas': {
+                    'reaproveitadas': near_reused,
+                    'limiar': self.near_duplicate_threshold,
+                },
+                'cache': {
+                    'reaproveitados': stats.get('cache_hits', 0),
+                    'consultas': stats.get('cache_misses', 0),
+                },
+                'modelo_local': {
+                    'respondidos': stats.get('local_answers', 0),
+                    'limiar': self.local_model_threshold,
+                },
+            }
+            self.write_report(output_path, report)
+            self.post_progress(100, f"✅ {processed}/{total} arquivos organizados")
+            
+            self.log(f"🎉 Concluído! {processed}/{total} em {duration.total_seconds():.1f}s")
+            if self.cache is not None:
+                self.log(f"💾 Cache: {stats.get('cache_hits', 0)} reaproveitados, "
+                         f"{stats.get('cache_misses', 0)} consultas à IA")
+            if pipeline.errors:
+                self.log(f"⚠️ {len(pipeline.errors)} falhas inesperadas no pipeline "
+                         f"(ver 'erros_pipeline' no relatório)")
+            if near_reused:
+                self.log(f"♻️ Quase-duplicatas: {near_reused} arquivos com a categoria de um vizinho")
+            if stats.get('local_answers'):
+                self.log(f"🧠 Modelo local: {stats['local_answers']} arquivos sem chamar a IA")
+            
+            self.notify('showinfo', "Sucesso!", f"✅ {processed}/{total} arquivos organizados!")
+            return report
+            
+        except Exception as e:
+            self.log(f"❌ Erro: {str(e)}")
+            self.notify('showerror', "Erro", f"Erro: {str(e)}")
+            return None
+        finally:
+            if self.near_index is not None:
+                self.near_index.close()
+                self.near_index = None
+    
+    def start_file_log(self):
+        """Inicia o gravador em segundo plano do histórico em JSON-lines"""
+        try:
+            self.file_logger, self.log_listener = start_file_log(self.log_file, self.log_max_bytes,
+                                                                 self.log_backups)
+        except OSError as e:
+            self.log(f"⚠️ Histórico em arquivo desativado: {str(e)}")
+    
+    def stop_file_log(self):
+        """Esvazia a fila do gravador e fecha o arquivo de log"""
+        if self.log_listener is not None:
+            self.log_listener.stop()
+            for handler in self.log_listener.handlers:
+                handler.close()
+            self.log_listener = None
+            self.file_logger = None
+    
+    def log(self, message):
+        """Log (chamado por vários workers do pipeline): histórico em arquivo + display_log"""
+        logger = self.file_logger
+        if logger is not None:
+            logger.log(log_level(message), message)
+        self.display_log(message)
+    
+    def make_setting(self, value):
+        """Valor de configuração com get/set (a interface troca por tk.StringVar)"""
+        return Setting(value)
+    
+    def display_log(self, message):
+        """Sem interface: mensagens legíveis vão para o stderr"""
+        print(message, file=sys.stderr, flush=True)
+    
+    def post_progress(self, percent, status):
+        """Progresso da execução (sem interface, só o log registra)"""
+    
+    def notify(self, kind, title, message):
+        """Aviso ao usuário (showinfo/showerror); sem interface vira linha de log"""
+        self.log(message)
+    
+    def report_result(self, record):
+        """Resultado de cada arquivo (ver result_record); a linha de comando imprime em JSON"""
+    
+    def result_record(self, job, status=None):
+        """Resultado de um arquivo em formato serializável"""
+        record = {'arquivo': job.path}
+        if status is not None:
+            record['status'] = status
+        elif job.error is not None:
+            record.update(status='erro', erro=str(job.error))
+        else:
+            record.update(status='duplicata' if job.duplicate_of is not None else 'ok',
+                          categoria=job.result['category'], nome=job.final_name or job.result['name'],
+                          destino=job.final_path)
+        return record
+
+
+# =============== INTERFACE ===============
+# Os workers nunca tocam no Tk: postam eventos numa fila que o mainloop
+# drena em lote a cada UI_REFRESH_MS
+UI_REFRESH_MS = 100
+
+
+class FileOrganizer(OrganizerEngine):
     def __init__(self):
+        load_gui_modules()
         self.root = tk.Tk()
         self.root.title("Organizador Inteligente de Arquivos com IA")
         self.root.geometry("800x700")
         self.root.configure(bg="#f0f0f0")
         
-        self.input_folder = tk.StringVar()
-        self.output_folder = tk.StringVar()
         self.progress_var = tk.DoubleVar()
         self.status_var = tk.StringVar(value="Configure a API do Gemini para começar")
-        
-        self.gemini_api_key = ""
-        self.model = None
-        self.config_file = "organizer_config.json"
+        self.ui_events = queue.Queue()  # ('log', texto) | ('progresso', %, status) | ('aviso', tipo, título, texto) | ('chamada', função)
         
         # Variáveis para logos/imagens
         self.logo_images = {}
         self.assets_folder = "assets"  # Pasta onde ficam os logos
         
+        super().__init__()
         self.create_assets_folder()
         self.load_logos()
         self.setup_ui()
-        self.load_config()
+        if self.model:
+            self.status_var.set("API configurada - Pronto para usar!")
+        self.root.after(UI_REFRESH_MS, self.drain_ui_events)
+    
+    def make_setting(self, value):
+        return tk.StringVar(value=value)
     
     def create_assets_folder(self):
         """Cria pasta para assets se não existir"""
@@ -98,50 +4115,19 @@ INSTRUÇÕES PARA ADICIONAR LOGOS/IMAGENS:
                     clean_name = os.path.splitext(filename)[0].lower()
                     self.logo_images[clean_name] = tk_image
                     
-                except Exception as e:
-                    print(f"Erro ao carregar {filename}: {e}")
-    
-    def get_logo(self, name):
-        """Retorna logo específico ou None se não encontrado"""
-        return self.logo_images.get(name.lower())
-    
-    def load_config(self):
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.gemini_api_key = config.get('api_key', '')
-                    if self.gemini_api_key:
-                        self.setup_gemini()
-                        self.status_var.set("API configurada - Pronto para usar!")
-        except Exception as e:
-            self.log(f"Erro ao carregar configurações: {str(e)}")
-    
-    def save_config(self):
-        try:
-            config = {'api_key': self.gemini_api_key}
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f)
-        except Exception as e:
-            self.log(f"Erro ao salvar configurações: {str(e)}")
+                except Exception as e:
+                    print(f"Erro ao carregar {filename}: {e}")
     
-    def setup_gemini(self):
-        try:
-            if not self.gemini_api_key:
-                return False
-            genai.configure(api_key=self.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            return True
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao configurar Gemini: {str(e)}")
-            return False
+    def get_logo(self, name):
+        """Retorna logo específico ou None se não encontrado"""
+        return self.logo_images.get(name.lower())
     
     def configure_api(self):
         api_key = simpledialog.askstring("Configurar API do Gemini", "Cole sua chave API do Gemini:", show='*')
         
         if api_key and api_key.strip():
             self.gemini_api_key = api_key.strip()
-            if self.setup_gemini():
+            if self.setup_backend():
                 self.save_config()
                 self.status_var.set("API configurada com sucesso!")
                 messagebox.showinfo("Sucesso", "API do Gemini configurada com sucesso!")
@@ -243,7 +4229,21 @@ INSTRUÇÕES PARA ADICIONAR LOGOS/IMAGENS:
                            command=self.open_assets_folder, bg="#9b59b6", fg="white",
                            font=("Segoe UI", 11), pady=10, relief="flat",
                            cursor="hand2")
-        logo_btn.pack(side="left")
+        logo_btn.pack(side="left", padx=(0, 10))
+        
+        # Botão para apagar o cache de classificações
+        cache_btn = tk.Button(api_frame, text="🗑️ Limpar Cache", 
+                            command=self.clear_cache, bg="#7f8c8d", fg="white",
+                            font=("Segoe UI", 11), pady=10, relief="flat",
+                            cursor="hand2")
+        cache_btn.pack(side="left", padx=(0, 10))
+        
+        # Botão de avaliação do modelo local contra as decisões do Gemini
+        model_btn = tk.Button(api_frame, text="📊 Modelo Local", 
+                            command=self.show_local_model_evaluation, bg="#16a085", fg="white",
+                            font=("Segoe UI", 11), pady=10, relief="flat",
+                            cursor="hand2")
+        model_btn.pack(side="left")
         
         # =============== SELEÇÃO DE PASTAS ===============
         folder_frame = tk.LabelFrame(main_content, text="📁 Seleção de Pastas", 
@@ -280,6 +4280,21 @@ INSTRUÇÕES PARA ADICIONAR LOGOS/IMAGENS:
                               cursor="hand2", padx=15)
         output_btn.pack(side="right", padx=(10, 0))
         
+        # Modo de saída: como o arquivo chega ao destino
+        mode_frame = tk.Frame(folder_frame, bg="#f0f0f0")
+        mode_frame.pack(fill="x", pady=(15, 5), padx=15)
+        
+        tk.Label(mode_frame, text="Modo de saída:", bg="#f0f0f0", 
+                font=("Segoe UI", 10, "bold")).pack(side="left")
+        
+        mode_combo = ttk.Combobox(mode_frame, textvariable=self.output_mode, values=OUTPUT_MODES,
+                                  state="readonly", width=12, font=("Segoe UI", 10))
+        mode_combo.pack(side="left", padx=(10, 0))
+        mode_combo.bind("<<ComboboxSelected>>", lambda event: self.save_config())
+        
+        tk.Label(mode_frame, text="copy = copiar · move = mover · auto = sem duplicar bytes no mesmo disco",
+                bg="#f0f0f0", fg="#7f8c8d", font=("Segoe UI", 9)).pack(side="left", padx=(10, 0))
+        
         # =============== BOTÃO PROCESSAR ===============
         process_frame = tk.Frame(main_content, bg="#f0f0f0")
         process_frame.pack(pady=20)
@@ -321,6 +4336,12 @@ INSTRUÇÕES PARA ADICIONAR LOGOS/IMAGENS:
         self.log_text.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
+        # A tela guarda só as últimas linhas; o histórico completo é pesquisado no arquivo
+        search_btn = tk.Button(log_frame, text="🔎 Buscar no Histórico", 
+                             command=self.show_log_search, bg="#34495e", fg="white",
+                             font=("Segoe UI", 10), relief="flat", cursor="hand2")
+        search_btn.pack(anchor="e", padx=15, pady=(0, 10))
+        
         # =============== MARCA D'ÁGUA (OPCIONAL) ===============
         watermark = self.get_logo('watermark')
         if watermark:
@@ -372,347 +4393,662 @@ INSTRUÇÕES PARA ADICIONAR LOGOS/IMAGENS:
         if folder:
             self.output_folder.set(folder)
     
-    # [RESTO DOS MÉTODOS MANTIDOS IGUAIS - extract_content, analyze_with_gemini, etc.]
-    def extract_content(self, file_path):
-        """Extrai conteúdo do arquivo"""
-        ext = Path(file_path).suffix.lower()
-        
-        try:
-            if ext == '.pdf':
-                with open(file_path, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    text = ""
-                    for page in reader.pages[:3]:  # Apenas 3 primeiras páginas
-                        text += page.extract_text() + "\n"
-                    return text
-            
-            elif ext in ['.docx', '.doc']:
-                doc = Document(file_path)
-                text = ""
-                for i, para in enumerate(doc.paragraphs[:20]):  # Apenas 20 primeiros parágrafos
-                    text += para.text + "\n"
-                return text
-            
-            elif ext in ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.log']:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    return file.read()[:3000]  # Apenas 3000 primeiros caracteres
-            
-            return ""
-        except:
-            return ""
+    def show_local_model_evaluation(self):
+        """Mostra a concordância do modelo local com o Gemini e as chamadas economizadas"""
+        model = self.open_local_model()
+        if model is None:
+            messagebox.showinfo("Modelo Local", "Modelo local indisponível (instale o NumPy: pip install numpy)")
+            return
+        messagebox.showinfo("Modelo Local", model.evaluation())
     
-    def analyze_with_gemini(self, content, filename):
-        """Análise inteligente com categorização específica"""
-        try:
-            prompt = f"""
-            Analise este documento e classifique em uma das categorias EXATAS abaixo:
-
-            CATEGORIAS DISPONÍVEIS:
-            - Oficios_e_Pareceres
-            - Relatorios_e_Analises  
-            - Processos_Judiciais
-            - Ouvidoria_e_Reclamacoes
-            - Contratos_e_Acordos
-            - Leis_e_Normativas
-            - Deliberacoes_e_Resolucoes
-            - Documentos_Pessoais
-            - Financeiro_e_Pagamentos
-            - Correspondencias_Gerais
-            - Outros_Documentos
-
-            NOME ORIGINAL: {filename}
-            CONTEÚDO: {content[:2000]}
-
-            REGRAS DE CATEGORIZAÇÃO:
-            - Ofício, parecer, memo, circular, comunicado = "Oficios_e_Pareceres"
-            - E-proc, processo, sentença, decisão, acórdão, despacho = "Processos_Judiciais"
-            - Ouvidoria, reclamação, denúncia, manifestação = "Ouvidoria_e_Reclamacoes"
-            - Relatório, análise, levantamento, estudo = "Relatorios_e_Analises"
-            - Contrato, convênio, acordo, termo = "Contratos_e_Acordos"
-            - Lei, decreto, portaria, resolução normativa = "Leis_e_Normativas"
-            - Deliberação, ata, resolução administrativa = "Deliberacoes_e_Resolucoes"
-            - CPF, RG, certidão, comprovante residência = "Documentos_Pessoais"
-            - Fatura, nota fiscal, comprovante pagamento = "Financeiro_e_Pagamentos"
-            - E-mail, carta, notificação = "Correspondencias_Gerais"
-
-            REGRAS PARA NOME:
-            - SEMPRE incluir o ASSUNTO PRINCIPAL do documento
-            - Se mencionar NOME DE PESSOA, incluir no título
-            - Se mencionar EMPRESA/ÓRGÃO, incluir no título
-            - NUNCA usar apenas datas (ex: "2024-01-15")
-            - NUNCA usar nomes genéricos (ex: "Documento", "Arquivo")
-            - Ser ESPECÍFICO sobre o conteúdo (ex: "Contrato Fornecimento João Silva", "Relatório Vendas Janeiro 2024")
-            - Máximo 70 caracteres
-
-            RESPOSTA FORMATO EXATO:
-            CATEGORIA: [uma das categorias acima]
-            NOME: [nome específico e descritivo sobre o conteúdo]
-            """
-            
-            response = self.model.generate_content(prompt)
-            return self.parse_response(response.text, filename)
-            
-        except Exception as e:
-            self.log(f"⚠️ Erro IA para {filename}: {str(e)}")
-            return self.fallback_analysis(filename)
+    def start_processing(self):
+        """Inicia processamento"""
+        if not self.model:
+            messagebox.showerror("Erro", "Configure a API primeiro!")
+            return
+        
+        # As variáveis Tk só podem ser lidas aqui, na thread principal
+        input_path = self.input_folder.get()
+        output_path = self.output_folder.get()
+        output_mode = self.output_mode.get()
+        if not input_path or not output_path:
+            messagebox.showerror("Erro", "Selecione as pastas!")
+            return
+        
+        if messagebox.askyesno("Confirmar", "Iniciar processamento?"):
+            self.log_text.delete(1.0, tk.END)
+            self.progress_var.set(0)
+            thread = threading.Thread(target=self.process_files,
+                                      args=(input_path, output_path, output_mode))
+            thread.daemon = True
+            thread.start()
     
-    def parse_response(self, response_text, filename):
-        """Extrai categoria e nome da resposta"""
-        try:
-            lines = response_text.strip().split('\n')
-            category = "Outros_Documentos"
-            name = Path(filename).stem
-            
-            for line in lines:
-                if line.startswith('CATEGORIA:'):
-                    category = line.replace('CATEGORIA:', '').strip()
-                elif line.startswith('NOME:'):
-                    name = line.replace('NOME:', '').strip()
-            
-            # Valida se o nome não é genérico demais
-            name = self.validate_filename(name, filename)
-            
-            return {'category': category, 'name': name[:70]}
-        except:
-            return self.fallback_analysis(filename)
+    def display_log(self, message):
+        """Só enfileira: o mainloop insere no widget (chamado por vários workers)"""
+        self.ui_events.put(('log', message))
     
-    def validate_filename(self, proposed_name, original_filename):
-        """Valida e melhora nomes genéricos"""
-        proposed_lower = proposed_name.lower().strip()
+    def show_log_search(self):
+        """Janela de busca no histórico completo (lido do arquivo, fora do widget de log)"""
+        window = tk.Toplevel(self.root)
+        window.title("Buscar no Histórico")
+        window.geometry("760x480")
+        window.configure(bg="#f0f0f0")
         
-        # Lista de nomes genéricos para evitar
-        generic_names = [
-            'documento', 'arquivo', 'file', 'doc', 'pdf', 'texto',
-            'untitled', 'sem titulo', 'novo', 'copia', 'copy'
-        ]
+        controls = tk.Frame(window, bg="#f0f0f0")
+        controls.pack(fill="x", padx=10, pady=10)
+        text_var = tk.StringVar()
+        level_var = tk.StringVar(value="Todos")
+        entry = tk.Entry(controls, textvariable=text_var, font=("Segoe UI", 10))
+        entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        ttk.Combobox(controls, textvariable=level_var, values=("Todos",) + LOG_LEVELS,
+                     state="readonly", width=10).pack(side="left", padx=(0, 10))
         
-        # Verifica se é só data (regex para formatos de data)
-        date_patterns = [
-            r'^\d{4}-\d{2}-\d{2}$',  # 2024-01-15
-            r'^\d{2}/\d{2}/\d{4}$',  # 15/01/2024
-            r'^\d{2}-\d{2}-\d{4}$',  # 15-01-2024
-            r'^\d{8}$',              # 20240115
-        ]
+        results = tk.Text(window, wrap="word", font=("Consolas", 10),
+                          bg="#2c3e50", fg="#ecf0f1", relief="flat", bd=0)
+        results.pack(fill="both", expand=True, padx=10, pady=(0, 10))
         
-        is_generic = any(generic in proposed_lower for generic in generic_names)
-        is_only_date = any(re.match(pattern, proposed_lower) for pattern in date_patterns)
-        is_too_short = len(proposed_lower.replace(' ', '')) < 3
+        def show(records):
+            if not results.winfo_exists():
+                return
+            results.delete(1.0, tk.END)
+            lines = [f"{r.get('ts', '')} [{r.get('nivel', '')}] {r.get('msg', '')}" for r in records]
+            if len(records) >= LOG_SEARCH_LIMIT:
+                lines.insert(0, f"(mostrando os {LOG_SEARCH_LIMIT} registros mais recentes)")
+            results.insert(tk.END, "\n".join(lines) if lines else "Nenhum registro encontrado.")
+            results.see(tk.END)
         
-        if is_generic or is_only_date or is_too_short:
-            # Tenta extrair algo melhor do nome original
-            original_clean = Path(original_filename).stem.replace('_', ' ').replace('-', ' ')
-            if len(original_clean) > 5:
-                return f"Documento - {original_clean}"
-            else:
-                return f"Documento - {original_filename}"
+        def search(*_):
+            level = level_var.get()
+            text = text_var.get()
+            results.delete(1.0, tk.END)
+            results.insert(tk.END, "Buscando...")
+            
+            def worker():
+                records = search_log(self.log_file, text, None if level == "Todos" else level,
+                                     self.log_backups)
+                self.ui_events.put(('chamada', lambda: show(records)))
+            
+            threading.Thread(target=worker, daemon=True).start()
         
-        return proposed_name
+        tk.Button(controls, text="Buscar", command=search, bg="#3498db", fg="white",
+                  font=("Segoe UI", 10), relief="flat", cursor="hand2").pack(side="left")
+        entry.bind("<Return>", search)
+        entry.focus_set()
     
-    def fallback_analysis(self, filename):
-        """Análise básica sem IA"""
-        name = Path(filename).stem.replace('_', ' ').replace('-', ' ')
-        ext = Path(filename).suffix.lower()
-        
-        # Categorização por palavras-chave
-        name_lower = name.lower()
-        content_lower = filename.lower()
-        
-        if any(word in content_lower for word in ['oficio', 'parecer', 'requer', 'solicit', 'memo', 'circular']):
-            category = "Oficios_e_Pareceres"
-        elif any(word in content_lower for word in ['eproc', 'processo', 'sentenca', 'decisao', 'judicial', 'acordao', 'despacho']):
-            category = "Processos_Judiciais"
-        elif any(word in content_lower for word in ['ouvidoria', 'reclamacao', 'denuncia', 'manifestacao']):
-            category = "Ouvidoria_e_Reclamacoes"
-        elif any(word in content_lower for word in ['relatorio', 'analise', 'levantamento', 'estudo']):
-            category = "Relatorios_e_Analises"
-        elif any(word in content_lower for word in ['contrato', 'acordo', 'convenio', 'termo']):
-            category = "Contratos_e_Acordos"
-        elif any(word in content_lower for word in ['lei', 'decreto', 'portaria', 'norma', 'resolucao']):
-            category = "Leis_e_Normativas"
-        elif any(word in content_lower for word in ['deliberacao', 'ata', 'resolucao']):
-            category = "Deliberacoes_e_Resolucoes"
-        elif any(word in content_lower for word in ['cpf', 'rg', 'certidao', 'identidade', 'comprovante']):
-            category = "Documentos_Pessoais"
-        elif any(word in content_lower for word in ['fatura', 'nota', 'pagamento', 'financeiro', 'orcamento']):
-            category = "Financeiro_e_Pagamentos"
-        elif any(word in content_lower for word in ['email', 'carta', 'notificacao', 'comunicacao']):
-            category = "Correspondencias_Gerais"
-        else:
-            category = "Outros_Documentos"
-        
-        # Melhora o nome baseado na categoria
-        improved_name = self.improve_name_by_category(name, category, filename)
-        
-        return {'category': category, 'name': improved_name}
+    def post_progress(self, percent, status):
+        self.ui_events.put(('progresso', percent, status))
     
-    def improve_name_by_category(self, name, category, filename):
-        """Melhora o nome baseado na categoria identificada"""
-        # Se o nome é muito genérico, melhora baseado na categoria
-        if len(name.strip()) < 5 or name.lower() in ['documento', 'arquivo', 'file']:
-            category_prefixes = {
-                "Oficios_e_Pareceres": "Ofício",
-                "Processos_Judiciais": "Processo",
-                "Ouvidoria_e_Reclamacoes": "Ouvidoria",
-                "Relatorios_e_Analises": "Relatório",
-                "Contratos_e_Acordos": "Contrato",
-                "Leis_e_Normativas": "Normativa",
-                "Deliberacoes_e_Resolucoes": "Deliberação",
-                "Documentos_Pessoais": "Documento Pessoal",
-                "Financeiro_e_Pagamentos": "Financeiro",
-                "Correspondencias_Gerais": "Correspondência",
-                "Outros_Documentos": "Documento"
-            }
-            prefix = category_prefixes.get(category, "Documento")
-            
-            # Tenta extrair data do nome original
-            date_match = re.search(r'(\d{4}[-_]\d{2}[-_]\d{2}|\d{2}[-_]\d{2}[-_]\d{4})', filename)
-            if date_match:
-                return f"{prefix} - {date_match.group(1)}"
-            else:
-                return f"{prefix} - {Path(filename).stem}"
-        
-        # Valida o nome proposto
-        return self.validate_filename(name, filename)
+    def notify(self, kind, title, message):
+        """Caixa de mensagem (showinfo/showerror) exibida pela thread da interface"""
+        self.ui_events.put(('aviso', kind, title, message))
     
-    def sanitize_filename(self, filename):
-        """Limpa nome do arquivo"""
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, ' ')
+    def drain_ui_events(self):
+        """Aplica os eventos pendentes de uma vez: um insert no log e só o último progresso"""
+        lines, progress, notices, calls = [], None, [], []
+        try:
+            while True:
+                event = self.ui_events.get_nowait()
+                if event[0] == 'log':
+                    lines.append(event[1])
+                elif event[0] == 'progresso':
+                    progress = event[1:]
+                elif event[0] == 'chamada':
+                    calls.append(event[1])
+                else:
+                    notices.append(event[1:])
+        except queue.Empty:
+            pass
         
-        # Remove espaços extras e limita tamanho
-        filename = ' '.join(filename.split())  # Remove espaços duplos
-        return filename.strip()[:70] or "Documento"
+        if lines:
+            # Buffer circular: mantém só as últimas log_view_lines linhas no widget
+            limit = max(1, self.log_view_lines)
+            self.log_text.insert(tk.END, "\n".join(lines[-limit:]) + "\n")
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - limit
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+        for call in calls:
+            call()
+        if progress is not None:
+            self.progress_var.set(progress[0])
+            self.status_var.set(progress[1])
+        for kind, title, message in notices:
+            getattr(messagebox, kind)(title, message)
+        self.root.after(UI_REFRESH_MS, self.drain_ui_events)
     
-    def process_file(self, file_path, output_base):
-        """Processa arquivo único"""
+    def run(self):
         try:
-            filename = os.path.basename(file_path)
-            self.log(f"🔍 {filename}")
-            
-            # Análise
-            content = self.extract_content(file_path)
-            if content and len(content.strip()) > 50:
-                result = self.analyze_with_gemini(content, filename)
-            else:
-                result = self.fallback_analysis(filename)
-            
-            # Cria pasta
-            category_folder = os.path.join(output_base, result['category'])
-            os.makedirs(category_folder, exist_ok=True)
-            
-            # Nome final
-            new_name = self.sanitize_filename(result['name'])
-            extension = Path(file_path).suffix
-            final_name = f"{new_name}{extension}"
-            
-            # Evita duplicatas
-            counter = 1
-            final_path = os.path.join(category_folder, final_name)
-            while os.path.exists(final_path):
-                final_name = f"{new_name} ({counter}){extension}"
-                final_path = os.path.join(category_folder, final_name)
-                counter += 1
-            
-            # Copia arquivo
-            shutil.copy2(file_path, final_path)
-            
-            self.log(f"   → {result['category']}/{final_name}")
-            return True
-            
-        except Exception as e:
-            self.log(f"❌ Erro: {filename} - {str(e)}")
-            return False
-    
-    def get_files(self, folder_path):
-        """Lista arquivos suportados"""
-        extensions = ['.pdf', '.docx', '.doc', '.txt', '.md', '.py', '.js', '.html', 
-                     '.css', '.json', '.xml', '.csv', '.xlsx', '.xls', '.jpg', '.png']
+            self.root.mainloop()
+        finally:
+            self.stop_file_log()
+
+
+# =============== SERVIÇO LOCAL ===============
+# Processo de longa duração: modelo, limitador de taxa, cache, modelo local e
+# pool de extração ficam aquecidos entre tarefas, que chegam por HTTP local
+# (POST /tarefas) e rodam de uma fila compartilhada
+DEFAULT_SERVICE_HOST = "127.0.0.1"
+DEFAULT_SERVICE_PORT = 8765
+DEFAULT_SERVICE_JOBS = 2            # Tarefas executadas ao mesmo tempo (destinos diferentes)
+SERVICE_MAX_FINISHED_JOBS = 200     # Tarefas encerradas mantidas para consulta
+SERVICE_JOB_LOG_LINES = 200
+SERVICE_RESULTS_PAGE = 1000
+SERVICE_MAX_JOB_RESULTS = 5000      # Resultados por tarefa guardados; os mais antigos saem primeiro
+SERVICE_RESULTS_KEPT_JOBS = 20      # Tarefas encerradas mais recentes que mantêm os resultados
+SERVICE_MAX_BODY = 1024 * 1024      # Tamanho máximo do corpo de um POST (bytes)
+SERVICE_TOKEN_HEADER = 'X-Omnifile-Token'
+JOB_TYPES = ('organizar', 'classificar')
+JOB_DONE_STATES = ('concluida', 'falhou', 'cancelada')
+
+
+class ServiceJob:
+    """Tarefa do serviço: parâmetros, estado, progresso, log e resultados por arquivo"""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.state = 'na_fila'  # na_fila → executando → concluida | falhou | cancelada
+        self.progress = 0.0
+        self.status = ""
+        self.error = None
+        self.report = None
+        # Só os últimos SERVICE_MAX_JOB_RESULTS; results_offset = índice do primeiro guardado
+        self.results = collections.deque(maxlen=SERVICE_MAX_JOB_RESULTS)
+        self.results_offset = 0
+        self.results_total = 0
+        self.log = collections.deque(maxlen=SERVICE_JOB_LOG_LINES)
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def summary(self, log_lines=0):
+        with self.lock:
+            data = {
+                'id': self.id,
+                'tipo': self.kind,
+                'parametros': self.params,
+                'estado': self.state,
+                'progresso': round(self.progress, 1),
+                'status': self.status,
+                'resultados': self.results_total,
+                'criada': self.created.isoformat(timespec='seconds'),
+                'inicio': self.started.isoformat(timespec='seconds') if self.started else None,
+                'fim': self.finished.isoformat(timespec='seconds') if self.finished else None,
+                'relatorio': self.report,
+                'erro': self.error,
+            }
+        if log_lines:
+            data['log'] = list(self.log)[-log_lines:]
+        return data
+
+    def add_result(self, record):
+        with self.lock:
+            if len(self.results) == self.results.maxlen:
+                self.results_offset += 1
+            self.results.append(record)
+            self.results_total += 1
+
+    def drop_results(self):
+        """Libera os resultados guardados (a contagem e o relatório continuam)"""
+        with self.lock:
+            self.results_offset = self.results_total
+            self.results.clear()
+
+    def page(self, start=0, limit=SERVICE_RESULTS_PAGE):
+        """Resultados a partir de `start`: o cliente segue em 'proximo' até a tarefa encerrar.
         
-        files = []
-        for root, dirs, filenames in os.walk(folder_path):
-            for filename in filenames:
-                if Path(filename).suffix.lower() in extensions:
-                    files.append(os.path.join(root, filename))
-        return files
+        Resultados que já saíram da memória são pulados; 'descartados' conta
+        quantos o cliente perdeu por consultar tarde demais.
+        """
+        with self.lock:
+            first = max(start, self.results_offset)
+            index = first - self.results_offset
+            results = list(itertools.islice(self.results, index, index + limit))
+            state = self.state
+        return {'id': self.id, 'estado': state, 'desde': start, 'descartados': first - start,
+                'proximo': first + len(results), 'resultados': results}
+
+
+class JobOrganizer(OrganizerEngine):
+    """Motor de uma tarefa do serviço.
+    
+    Compartilha com o motor do serviço o modelo, o limitador de taxa, o cache,
+    o modelo local e o pool de extração; só o estado da execução é próprio.
+    """
+
+    def __init__(self, base, job):
+        self.__dict__.update(base.__dict__)
+        self.job = job
+        self.input_folder = Setting("")
+        self.output_folder = Setting("")
+        self.output_mode = Setting(base.output_mode.get())
+        self.stage_workers = dict(base.stage_workers)
+        self.near_index = None
+        self.run_stats = {}  # O cache e o modelo local são compartilhados; os contadores não
+        self._stats_lock = threading.Lock()
+
+    def log(self, message):
+        logger = self.file_logger
+        if logger is not None:
+            logger.log(log_level(message), f"[{self.job.id}] {message}")
+        self.display_log(message)
+
+    def display_log(self, message):
+        self.job.log.append(message)
+
+    def post_progress(self, percent, status):
+        with self.job.lock:
+            self.job.progress = percent
+            self.job.status = status
+
+    def report_result(self, record):
+        self.job.add_result(record)
+
+    def save_config(self):
+        """As tarefas não regravam a configuração do serviço"""
+
+
+class OrganizerService:
+    """Fila de tarefas executada por `jobs` threads sobre um motor aquecido.
     
-    def process_files(self):
-        """Processamento principal"""
+    Tarefas de organização com o mesmo destino rodam uma de cada vez: o índice
+    de nomes e o diário de cada execução supõem que só ela grava no destino.
+    """
+
+    def __init__(self, engine, jobs=DEFAULT_SERVICE_JOBS, token=None):
+        self.engine = engine
+        self.token = token
+        self.queue = queue.Queue()
+        self.jobs = {}  # id → ServiceJob, em ordem de chegada
+        self.lock = threading.Lock()
+        self.destination_locks = {}  # destino normalizado → Lock da tarefa que grava nele
+        self.next_id = 1
+        self.workers = [threading.Thread(target=self._worker, name=f"tarefa-{index + 1}", daemon=True)
+                        for index in range(max(1, jobs))]
+
+    def start(self):
+        """Aquece os recursos compartilhados e inicia os executores de tarefas"""
+        engine = self.engine
+        engine.select_pdf_backend()
+        engine.open_cache()
+        engine.open_local_model()
+        engine.get_extraction_pool()
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind, params):
+        """Valida e enfileira uma tarefa; ValueError se os parâmetros forem inválidos"""
+        if kind == 'organizar':
+            origem, destino = params.get('origem'), params.get('destino')
+            if not isinstance(origem, str) or not os.path.isdir(origem):
+                raise ValueError("'origem' deve ser uma pasta existente")
+            if not isinstance(destino, str) or not destino:
+                raise ValueError("'destino' é obrigatório")
+            modo = params.get('modo')
+            if modo is not None and modo not in OUTPUT_MODES:
+                raise ValueError(f"'modo' deve ser um de: {', '.join(OUTPUT_MODES)}")
+            params = {'origem': origem, 'destino': destino, 'modo': modo}
+        elif kind == 'classificar':
+            arquivos = params.get('arquivos')
+            if (not isinstance(arquivos, list) or not arquivos
+                    or not all(isinstance(path, str) for path in arquivos)):
+                raise ValueError("'arquivos' deve ser uma lista de caminhos")
+            params = {'arquivos': arquivos}
+        else:
+            raise ValueError(f"'tipo' deve ser um de: {', '.join(JOB_TYPES)}")
+        
+        with self.lock:
+            job = ServiceJob(str(self.next_id), kind, params)
+            self.next_id += 1
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def all_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """Cancela uma tarefa que ainda está na fila (as que já rodam vão até o fim)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with job.lock:
+            if job.state != 'na_fila':
+                return False
+            job.state = 'cancelada'
+            job.finished = datetime.now()
+        return True
+
+    def _destination_lock(self, destino):
+        key = os.path.normcase(os.path.abspath(destino))
+        with self.lock:
+            return self.destination_locks.setdefault(key, threading.Lock())
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            with job.lock:
+                if job.state != 'na_fila':
+                    continue
+                job.state = 'executando'
+                job.started = datetime.now()
+            self._run(job)
+            self._prune()
+
+    def _run(self, job):
+        organizer = JobOrganizer(self.engine, job)
+        state, error, report = 'falhou', None, None
         try:
-            if not self.model:
-                messagebox.showerror("Erro", "Configure a API do Gemini!")
-                return
-            
-            input_path = self.input_folder.get()
-            output_path = self.output_folder.get()
-            
-            if not input_path or not output_path:
-                messagebox.showerror("Erro", "Selecione as pastas!")
-                return
-            
-            os.makedirs(output_path, exist_ok=True)
-            files = self.get_files(input_path)
-            
-            if not files:
-                messagebox.showinfo("Info", "Nenhum arquivo encontrado")
-                return
-            
-            self.log(f"🚀 Processando {len(files)} arquivos...")
-            
-            processed = 0
-            start_time = datetime.now()
-            
-            for i, file_path in enumerate(files):
-                if self.process_file(file_path, output_path):
-                    processed += 1
-                
-                progress = ((i + 1) / len(files)) * 100
-                self.progress_var.set(progress)
-                self.status_var.set(f"Processando {i + 1}/{len(files)}")
-                self.root.update()
-            
-            duration = datetime.now() - start_time
-            self.progress_var.set(100)
-            self.status_var.set(f"✅ {processed}/{len(files)} arquivos organizados")
-            
-            self.log(f"🎉 Concluído! {processed}/{len(files)} em {duration.total_seconds():.1f}s")
-            
-            messagebox.showinfo("Sucesso!", f"✅ {processed}/{len(files)} arquivos organizados!")
-            
+            if job.kind == 'organizar':
+                organizer.input_folder.set(job.params['origem'])
+                organizer.output_folder.set(job.params['destino'])
+                if job.params['modo']:
+                    organizer.output_mode.set(job.params['modo'])
+                lock = self._destination_lock(job.params['destino'])
+                if not lock.acquire(blocking=False):
+                    organizer.post_progress(0.0, "Aguardando outra tarefa com o mesmo destino")
+                    lock.acquire()
+                try:
+                    report = organizer.process_files()
+                finally:
+                    lock.release()
+            else:
+                report = organizer.classify_files(job.params['arquivos'])
+            if report is not None:
+                state = 'concluida'
+            else:
+                error = job.log[-1] if job.log else "execução interrompida"
         except Exception as e:
-            self.log(f"❌ Erro: {str(e)}")
-            messagebox.showerror("Erro", f"Erro: {str(e)}")
+            error = str(e)
+            self.engine.log(f"❌ Tarefa {job.id}: {error}")
+        with job.lock:
+            job.state = state
+            job.error = error
+            job.report = report
+            job.finished = datetime.now()
+            if state == 'concluida':
+                job.progress = 100.0
+
+    def _prune(self):
+        """Descarta as tarefas encerradas mais antigas além de SERVICE_MAX_FINISHED_JOBS e
+        os resultados por arquivo das que vêm antes das SERVICE_RESULTS_KEPT_JOBS mais recentes"""
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.state in JOB_DONE_STATES]
+            for job_id in finished[:max(0, len(finished) - SERVICE_MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
+            stale = [self.jobs[job_id] for job_id in finished[:-SERVICE_RESULTS_KEPT_JOBS] if job_id in self.jobs]
+        for job in stale:
+            job.drop_results()
+
+    def serve(self, host=DEFAULT_SERVICE_HOST, port=DEFAULT_SERVICE_PORT):
+        """Servidor HTTP (uma thread por conexão); roda até serve_forever ser interrompido"""
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+        server.service = self
+        return server
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """API JSON do serviço:
     
-    def start_processing(self):
-        """Inicia processamento"""
-        if not self.model:
-            messagebox.showerror("Erro", "Configure a API primeiro!")
+    GET    /saude                              estado do serviço
+    GET    /tarefas                            todas as tarefas
+    POST   /tarefas                            {"tipo": "organizar", "origem", "destino", "modo"?}
+                                               {"tipo": "classificar", "arquivos": [...]}
+    GET    /tarefas/<id>                       estado, progresso, relatório e últimas linhas do log
+    GET    /tarefas/<id>/resultados?desde=N    resultados por arquivo a partir do N-ésimo
+    DELETE /tarefas/<id>                       cancela uma tarefa ainda na fila
+    """
+    protocol_version = 'HTTP/1.1'  # Keep-alive para clientes que consultam o progresso
+
+    def log_message(self, format, *args):
+        """Acessos não vão para o stderr (o log do serviço registra as tarefas)"""
+
+    def _send(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.service.token
+        if token and not hmac.compare_digest(self.headers.get(SERVICE_TOKEN_HEADER, ''), token):
+            self._send(401, {'erro': f"cabeçalho {SERVICE_TOKEN_HEADER} ausente ou inválido"})
+            return False
+        return True
+
+    def _route(self):
+        """(partes do caminho, parâmetros da query)"""
+        url = urlsplit(self.path)
+        return [part for part in url.path.split('/') if part], parse_qs(url.query)
+
+    def do_GET(self):
+        if not self._authorized():
             return
-        
-        if not self.input_folder.get() or not self.output_folder.get():
-            messagebox.showerror("Erro", "Selecione as pastas!")
+        service = self.server.service
+        parts, query = self._route()
+        if parts == ['saude']:
+            return self._send(200, {'ok': True, 'modelo': service.engine.model.model_id,
+                                    'na_fila': service.queue.qsize(), 'tarefas': len(service.all_jobs())})
+        if parts == ['tarefas']:
+            return self._send(200, [job.summary() for job in service.all_jobs()])
+        if len(parts) in (2, 3) and parts[0] == 'tarefas':
+            job = service.get(parts[1])
+            if job is None:
+                return self._send(404, {'erro': "tarefa não encontrada"})
+            if len(parts) == 2:
+                return self._send(200, job.summary(log_lines=20))
+            if parts[2] == 'resultados':
+                try:
+                    start = max(0, int(query.get('desde', ['0'])[0]))
+                    limit = max(1, min(SERVICE_RESULTS_PAGE, int(query.get('limite', [SERVICE_RESULTS_PAGE])[0])))
+                except ValueError:
+                    return self._send(400, {'erro': "'desde' e 'limite' devem ser inteiros"})
+                return self._send(200, job.page(start, limit))
+        self._send(404, {'erro': "rota não encontrada"})
+
+    def do_POST(self):
+        if not self._authorized():
             return
-        
-        if messagebox.askyesno("Confirmar", "Iniciar processamento?"):
-            self.log_text.delete(1.0, tk.END)
-            self.progress_var.set(0)
-            thread = threading.Thread(target=self.process_files)
-            thread.daemon = True
-            thread.start()
+        parts, _ = self._route()
+        if parts != ['tarefas']:
+            return self._send(404, {'erro': "rota não encontrada"})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= SERVICE_MAX_BODY:
+            self.close_connection = True  # O corpo não foi lido: a conexão não pode ser reaproveitada
+            return self._send(413, {'erro': f"corpo deve ter entre 0 e {SERVICE_MAX_BODY} bytes"})
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("o corpo deve ser um objeto JSON")
+            job = self.server.service.submit(params.get('tipo'), params)
+        except ValueError as e:
+            return self._send(400, {'erro': str(e)})
+        self._send(202, job.summary())
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != 'tarefas':
+            return self._send(404, {'erro': "rota não encontrada"})
+        cancelled = self.server.service.cancel(parts[1])
+        if cancelled is None:
+            return self._send(404, {'erro': "tarefa não encontrada"})
+        if not cancelled:
+            return self._send(409, {'erro': "a tarefa já começou ou terminou"})
+        self._send(200, self.server.service.get(parts[1]).summary())
+
+
+# =============== LINHA DE COMANDO ===============
+# Mesmo motor, sem tkinter: um JSON por arquivo no stdout, log legível no stderr
+EXIT_OK = 0            # Todos os arquivos organizados
+EXIT_FILE_ERRORS = 1   # Execução concluída, mas algum arquivo falhou
+EXIT_USAGE = 2         # Argumentos ou configuração inválidos (mesmo código do argparse)
+EXIT_FATAL = 3         # A execução foi interrompida
+
+
+class HeadlessOrganizer(OrganizerEngine):
+    """Organizador sem interface: cada resultado vira uma linha JSON em `output`"""
+
+    def __init__(self, config_file=DEFAULT_CONFIG_FILE, quiet=False, output=None):
+        self.quiet = quiet
+        self.output = output or sys.stdout
+        self._output_lock = threading.Lock()
+        super().__init__(config_file)
+
+    def display_log(self, message):
+        if not self.quiet:
+            super().display_log(message)
+
+    def report_result(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def save_config(self):
+        """Argumentos da linha de comando valem só para esta execução: não regrava a configuração"""
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Organiza arquivos com IA sem interface gráfica (resultados em JSON-lines no stdout)")
+    parser.add_argument('origem', nargs='?', help="pasta com os arquivos")
+    parser.add_argument('destino', nargs='?', help="pasta onde os arquivos organizados serão gravados")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="concorrência: workers por estágio e processos de extração")
+    parser.add_argument('-m', '--modo', choices=OUTPUT_MODES, help="modo de saída (padrão: o da configuração)")
+    parser.add_argument('-c', '--config', default=DEFAULT_CONFIG_FILE, help="arquivo de configuração")
+    parser.add_argument('-b', '--backend', choices=tuple(CLASSIFIER_BACKENDS),
+                        help="backend de classificação (padrão: o da configuração; 'stub' = offline/teste de carga)")
+    parser.add_argument('--api-key', default=os.environ.get('GEMINI_API_KEY'),
+                        help="chave da API do Gemini (padrão: $GEMINI_API_KEY ou a da configuração)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="não escreve o log no stderr")
+    parser.add_argument('--avaliar-modelo', action='store_true',
+                        help="mostra a concordância do modelo local com a IA e sai (sem pastas)")
     
-    def log(self, message):
-        """Log simplificado"""
-        self.log_text.insert(tk.END, f"{message}\n")
-        self.log_text.see(tk.END)
-        self.root.update()
+    service = parser.add_argument_group("serviço local (tarefas por HTTP, modelo sempre aquecido)")
+    service.add_argument('--servico', action='store_true', help="roda como serviço em vez de organizar uma pasta")
+    service.add_argument('--host', default=DEFAULT_SERVICE_HOST, help="endereço de escuta (padrão: %(default)s)")
+    service.add_argument('--porta', type=int, default=DEFAULT_SERVICE_PORT, help="porta (padrão: %(default)s)")
+    service.add_argument('--tarefas', type=int, default=DEFAULT_SERVICE_JOBS,
+                         help="tarefas executadas ao mesmo tempo; as de mesmo destino esperam a vez "
+                              "(padrão: %(default)s)")
+    service.add_argument('--token', default=os.environ.get('OMNIFILE_TOKEN'),
+                         help=f"exige o cabeçalho {SERVICE_TOKEN_HEADER} (padrão: $OMNIFILE_TOKEN)")
+    return parser
+
+
+def main_cli(argv=None):
+    """Executa o organizador sem interface; retorna o código de saída (EXIT_*)"""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.avaliar_modelo:
+        if args.origem or args.destino or args.servico:
+            parser.error("--avaliar-modelo não recebe pastas nem --servico")
+    elif args.servico:
+        if args.origem or args.destino:
+            parser.error("--servico não recebe pastas: envie tarefas por POST /tarefas")
+    elif not args.origem or not args.destino:
+        parser.error("informe as pastas de origem e destino (ou use --servico)")
+    elif not os.path.isdir(args.origem):
+        parser.error(f"pasta de origem não encontrada: {args.origem}")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers deve ser maior que zero")
     
-    def run(self):
-        self.root.mainloop()
+    organizer = HeadlessOrganizer(args.config, quiet=args.quiet)
+    try:
+        if args.avaliar_modelo:
+            return evaluate_local_model(organizer)
+        if args.api_key:
+            organizer.gemini_api_key = args.api_key
+        if args.backend:
+            organizer.classifier_backend = args.backend
+        if (args.api_key or args.backend) and not organizer.setup_backend():
+            organizer.model = None
+        if not organizer.model:
+            print("❌ Configure o backend de classificação (--backend, --api-key/$GEMINI_API_KEY "
+                  "ou a configuração)", file=sys.stderr)
+            return EXIT_USAGE
+        
+        if args.modo:
+            organizer.output_mode.set(args.modo)
+        if args.workers:
+            organizer.stage_workers = {stage: args.workers for stage in organizer.stage_workers}
+            organizer.extraction_processes = args.workers
+        if args.servico:
+            return run_service(organizer, args)
+        
+        organizer.input_folder.set(args.origem)
+        organizer.output_folder.set(args.destino)
+        report = organizer.process_files()
+        if report is None:
+            return EXIT_FATAL
+        organizer.report_result({'resumo': report})
+        return EXIT_FILE_ERRORS if report['erros'] else EXIT_OK
+    except KeyboardInterrupt:
+        return EXIT_FATAL
+    finally:
+        if organizer.extraction_pool is not None:
+            organizer.extraction_pool.close()
+        if organizer.model is not None:
+            organizer.model.close()
+        organizer.stop_file_log()
+
+
+def evaluate_local_model(organizer):
+    """Avaliação do modelo local: texto no log, números em JSON no stdout"""
+    model = organizer.open_local_model()
+    if model is None:
+        print("❌ Modelo local indisponível (instale o NumPy: pip install numpy, "
+              "e ative local_model_enabled)", file=sys.stderr)
+        return EXIT_USAGE
+    organizer.log(model.evaluation())
+    organizer.report_result({'modelo_local': dict(model.summary(), limiar=organizer.local_model_threshold)})
+    return EXIT_OK
+
+
+def run_service(organizer, args):
+    """Serviço local até Ctrl+C; tarefas chegam por HTTP e compartilham o motor aquecido"""
+    service = OrganizerService(organizer, args.tarefas, args.token)
+    try:
+        server = service.serve(args.host, args.porta)
+    except OSError as e:
+        organizer.log(f"❌ Não foi possível escutar em {args.host}:{args.porta}: {str(e)}")
+        return EXIT_USAGE
+    service.start()
+    organizer.log(f"🛰️ Serviço em http://{args.host}:{server.server_address[1]} "
+                  f"({max(1, args.tarefas)} tarefas simultâneas)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        organizer.log("🛑 Serviço encerrado")
+    finally:
+        server.server_close()
+    return EXIT_OK
+
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Processos de extração em executáveis congelados
+    
+    # Com argumentos: linha de comando (não importa tkinter); sem argumentos: janela
+    if len(sys.argv) > 1:
+        sys.exit(main_cli())
+    
     try:
         import google.generativeai
-        import docx
         import PyPDF2
         from PIL import Image, ImageTk
     except ImportError as e:
@@ -722,11 +5058,6 @@ if __name__ == "__main__":
         except ImportError:
             missing_libs.append("google-generativeai")
         
-        try:
-            import docx
-        except ImportError:
-            missing_libs.append("python-docx")
-        
         try:
             import PyPDF2
         except ImportError:
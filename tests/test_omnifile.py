@@ -0,0 +1,320 @@
+"""Verificações automáticas do leitor de .doc, do diário e da publicação no destino.
+
+Rodam só com a biblioteca padrão (as dependências de IA e de PDF são importadas
+sob demanda pelo script):
+
+    python -m unittest discover tests
+"""
+import errno
+import importlib.util
+import json
+import os
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+SCRIPT = Path(__file__).resolve().parent.parent / "Omnifile - v6 - COM IMAGENS - Gemini 1.5 Flash (ClaudeAI).py"
+_spec = importlib.util.spec_from_file_location("omnifile", SCRIPT)
+omnifile = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(omnifile)
+
+SECTOR = 512
+MINI_SECTOR = 64
+MINI_CUTOFF = 4096
+FREE, END, FAT_SECTOR, NO_STREAM = 0xFFFFFFFF, 0xFFFFFFFE, 0xFFFFFFFD, 0xFFFFFFFF
+
+
+def _pad(data, unit):
+    return data + b"\0" * (-len(data) % unit)
+
+
+def build_cfb(streams):
+    """Arquivo OLE/CFB mínimo (versão 3) com os streams dados.
+
+    Streams menores que MINI_CUTOFF vão para o mini stream da raiz, como no Word.
+    Layout: setor 0 = FAT, 1 = diretório, 2 = MiniFAT, depois o mini stream e os
+    streams grandes.
+    """
+    fat = [FAT_SECTOR, END, END]
+    sectors = []  # Setores a partir do 3
+
+    def allocate(data):
+        first = 3 + len(sectors)
+        count = max(1, len(_pad(data, SECTOR)) // SECTOR)
+        for index in range(count):
+            fat.append(first + index + 1 if index + 1 < count else END)
+            sectors.append(_pad(data, SECTOR)[index * SECTOR:(index + 1) * SECTOR].ljust(SECTOR, b"\0"))
+        return first
+
+    minifat, mini_stream, entries = [], b"", []
+    for name, data in streams.items():
+        if len(data) < MINI_CUTOFF:
+            first = len(mini_stream) // MINI_SECTOR
+            count = max(1, len(_pad(data, MINI_SECTOR)) // MINI_SECTOR)
+            minifat.extend(first + index + 1 if index + 1 < count else END for index in range(count))
+            mini_stream += _pad(data, MINI_SECTOR).ljust(MINI_SECTOR, b"\0")
+            entries.append((name, 2, first, len(data)))
+        else:
+            entries.append((name, 2, None, data))
+    root_start = allocate(mini_stream)
+    entries = [(name, kind, allocate(data), len(data)) if start is None else (name, kind, start, data)
+               for name, kind, start, data in entries]
+    entries.insert(0, ("Root Entry", 5, root_start, len(mini_stream)))
+
+    directory = b""
+    for name, kind, start, size in entries:
+        encoded = (name + "\0").encode('utf-16-le')
+        entry = bytearray(128)
+        entry[:len(encoded)] = encoded
+        struct.pack_into('<HBB3I', entry, 0x40, len(encoded), kind, 1, NO_STREAM, NO_STREAM, NO_STREAM)
+        struct.pack_into('<II', entry, 0x74, start, size)
+        directory += bytes(entry)
+
+    header = bytearray(SECTOR)
+    header[:8] = omnifile.OLE_SIGNATURE
+    struct.pack_into('<HHHHH', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into('<8I', header, 0x2C, 1, 1, 0, MINI_CUTOFF, 2, 1, END, 0)
+    struct.pack_into('<109I', header, 0x4C, 0, *([FREE] * 108))
+
+    fat_sector = struct.pack(f'<{SECTOR // 4}I', *(fat + [FREE] * (SECTOR // 4 - len(fat))))
+    minifat_sector = struct.pack(f'<{SECTOR // 4}I', *(minifat + [FREE] * (SECTOR // 4 - len(minifat))))
+    return bytes(header) + fat_sector + _pad(directory, SECTOR) + minifat_sector + b"".join(sectors)
+
+
+def build_doc(pieces, text_chars=None):
+    """Documento Word 97 com uma peça por item de pieces: (texto, comprimida)"""
+    word = bytearray(0x1AA)
+    struct.pack_into('<HH', word, 0, omnifile.WORD_MAGIC, omnifile.WORD_97_NFIB + 1)
+    struct.pack_into('<H', word, 0x0A, 0x0200)  # Tabela em '1Table'
+    cps, descriptors = [0], []
+    for text, compressed in pieces:
+        offset = len(word)
+        if compressed:
+            word += text.encode('cp1252')
+            descriptors.append(0x40000000 | (offset * 2))
+        else:
+            word += text.encode('utf-16-le')
+            descriptors.append(offset)
+        cps.append(cps[-1] + len(text))
+    struct.pack_into('<I', word, 0x4C, cps[-1] if text_chars is None else text_chars)
+    word = bytes(word).ljust(MINI_CUTOFF, b"\0")  # Stream grande: setores normais da FAT
+
+    plc = struct.pack(f'<{len(cps)}I', *cps) + b"".join(struct.pack('<HIH', 0, fc, 0) for fc in descriptors)
+    prc = b"\x01" + struct.pack('<h', 2) + b"\0\0"  # Um bloco de formatação antes da tabela de peças
+    clx = prc + b"\x02" + struct.pack('<I', len(plc)) + plc
+    table = b"\0" * 16 + clx  # Stream pequeno: mini stream
+    word = bytearray(word)
+    struct.pack_into('<II', word, 0x1A2, 16, len(clx))
+    return build_cfb({'WordDocument': bytes(word), '1Table': table})
+
+
+class DocExtractionTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def write_doc(self, data):
+        path = os.path.join(self.folder.name, "ofício.doc")
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def test_reads_compressed_and_unicode_pieces(self):
+        path = self.write_doc(build_doc([("Ofício nº 12\r", True), ("Prazo: 30 dias – ação\r", False)]))
+        text = omnifile._extract_doc(path, 1000)
+        self.assertEqual(text, "Ofício nº 12\nPrazo: 30 dias – ação\n")
+
+    def test_drops_field_instructions_and_headers(self):
+        body = "Página \x13 PAGE \x14 1\x15 de 2\r"
+        path = self.write_doc(build_doc([(body + "Cabeçalho", True)], text_chars=len(body)))
+        self.assertEqual(omnifile._extract_doc(path, 1000), "Página  1 de 2\n")
+
+    def test_respects_budget(self):
+        path = self.write_doc(build_doc([("a" * 300, True)]))
+        self.assertEqual(omnifile._extract_doc(path, 50), "a" * 50)
+
+    def test_rejects_non_ole_file(self):
+        path = self.write_doc("texto simples, não é OLE".encode('utf-8') * 40)
+        with self.assertRaises(ValueError):
+            omnifile._extract_doc(path, 1000)
+
+    def test_rejects_encrypted_document(self):
+        data = bytearray(build_doc([("segredo", True)]))
+        word_start = 5 * SECTOR  # Setor 4 (depois de FAT, diretório, MiniFAT e mini stream), após o cabeçalho
+        struct.pack_into('<H', data, word_start + 0x0A, 0x0200 | 0x0100)
+        with self.assertRaises(ValueError):
+            omnifile._extract_doc(self.write_doc(bytes(data)), 1000)
+
+
+class ProcessingJournalTest(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.input_path = os.path.join(folder.name, "origem")
+        self.output_path = os.path.join(folder.name, "destino")
+        os.makedirs(self.input_path)
+
+    def job(self, name, size=10, mtime=1000):
+        job = omnifile.FileJob(os.path.join(self.input_path, name), size, mtime)
+        job.result = {'category': 'DOCUMENTOS', 'name': name}
+        job.final_path = os.path.join(self.output_path, 'DOCUMENTOS', name)
+        return job
+
+    def test_interrupted_run_is_resumed(self):
+        journal = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        self.assertFalse(journal.resumed)
+        journal.record(self.job("a.txt"))
+        journal.record(self.job("b.txt"))
+        journal.close()  # Sem finish: a execução foi interrompida
+
+        resumed = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        self.addCleanup(resumed.close)
+        self.assertTrue(resumed.resumed)
+        self.assertTrue(resumed.is_done(self.job("a.txt")))
+        self.assertTrue(resumed.is_done(self.job("b.txt")))
+        self.assertFalse(resumed.is_done(self.job("a.txt", mtime=2000)))  # Alterado desde então
+        self.assertFalse(resumed.is_done(self.job("c.txt")))
+
+    def test_finished_run_starts_over(self):
+        journal = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        journal.record(self.job("a.txt"))
+        journal.finish()
+
+        again = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        self.addCleanup(again.close)
+        self.assertFalse(again.resumed)
+        self.assertFalse(again.is_done(self.job("a.txt")))
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        journal.record(self.job("a.txt"))
+        journal.close()
+        with open(journal.path, 'a', encoding='utf-8') as file:
+            file.write('{"src": "cortado')  # Queda no meio da escrita
+
+        resumed = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        resumed.record(self.job("b.txt"))
+        resumed.close()
+        with open(journal.path, encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        self.assertEqual(json.loads(lines[-1])['src'], self.job("b.txt").path)
+
+        last = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        self.addCleanup(last.close)
+        self.assertTrue(last.is_done(self.job("a.txt")))
+        self.assertTrue(last.is_done(self.job("b.txt")))
+
+    def test_other_input_has_its_own_journal(self):
+        journal = omnifile.ProcessingJournal(self.output_path, self.input_path)
+        journal.record(self.job("a.txt"))
+        journal.close()
+
+        other = omnifile.ProcessingJournal(self.output_path, self.input_path + "-2")
+        self.addCleanup(other.close)
+        self.assertFalse(other.resumed)
+        self.assertNotEqual(other.path, journal.path)
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def write(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def read(self, path):
+        with open(path, encoding='utf-8') as file:
+            return file.read()
+
+    def leftovers(self):
+        return [name for name in os.listdir(self.folder) if name.endswith(".parcial")]
+
+    def test_publish_moves_to_free_name(self):
+        src, dst = self.write("novo", "novo"), os.path.join(self.folder, "final")
+        omnifile.publish_file(src, dst)
+        self.assertFalse(os.path.exists(src))
+        self.assertEqual(self.read(dst), "novo")
+
+    def test_publish_never_overwrites(self):
+        src, dst = self.write("novo", "novo"), self.write("final", "antigo")
+        with self.assertRaises(FileExistsError):
+            omnifile.publish_file(src, dst)
+        self.assertEqual(self.read(src), "novo")
+        self.assertEqual(self.read(dst), "antigo")
+
+    def test_publish_without_hardlinks(self):
+        unsupported = OSError(errno.EPERM, "sem hardlinks")
+        with mock.patch.object(omnifile.os, 'link', side_effect=unsupported):
+            src, dst = self.write("novo", "novo"), os.path.join(self.folder, "final")
+            omnifile.publish_file(src, dst)
+            self.assertFalse(os.path.exists(src))
+            self.assertEqual(self.read(dst), "novo")
+
+            src, taken = self.write("outro", "outro"), self.write("ocupado", "antigo")
+            with self.assertRaises(FileExistsError):
+                omnifile.publish_file(src, taken)
+            self.assertEqual(self.read(src), "outro")
+            self.assertEqual(self.read(taken), "antigo")
+
+    def test_copy_never_overwrites(self):
+        src, dst = self.write("origem", "novo"), self.write("final", "antigo")
+        with self.assertRaises(FileExistsError):
+            omnifile.OutputMaterializer('copy').place(src, dst)
+        self.assertEqual(self.read(src), "novo")
+        self.assertEqual(self.read(dst), "antigo")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_move_same_device(self):
+        materializer = omnifile.OutputMaterializer('move')
+        src, dst = self.write("origem", "novo"), os.path.join(self.folder, "final")
+        self.assertEqual(materializer.place(src, dst), 'move')
+        self.assertFalse(os.path.exists(src))
+        self.assertEqual(self.read(dst), "novo")
+
+        src = self.write("origem", "outro")
+        with self.assertRaises(FileExistsError):
+            materializer.place(src, dst)
+        self.assertEqual(self.read(src), "outro")
+        self.assertEqual(self.read(dst), "novo")
+
+    def test_move_other_device_keeps_source_until_published(self):
+        materializer = omnifile.OutputMaterializer('move')
+        with mock.patch.object(omnifile, 'same_device', return_value=False):
+            src, dst = self.write("origem", "novo"), os.path.join(self.folder, "final")
+            materializer.place(src, dst)
+            self.assertFalse(os.path.exists(src))
+            self.assertEqual(self.read(dst), "novo")
+
+            src = self.write("origem", "outro")
+            with self.assertRaises(FileExistsError):
+                materializer.place(src, dst)
+            self.assertEqual(self.read(src), "outro")  # A única cópia continua na origem
+            self.assertEqual(self.read(dst), "novo")
+            self.assertEqual(self.leftovers(), [])
+
+    def test_move_other_device_copy_failure_keeps_source(self):
+        materializer = omnifile.OutputMaterializer('move')
+        src, dst = self.write("origem", "novo"), os.path.join(self.folder, "final")
+        with mock.patch.object(omnifile, 'same_device', return_value=False), \
+                mock.patch.object(omnifile.shutil, 'copy2', side_effect=OSError(errno.ENOSPC, "disco cheio")):
+            with self.assertRaises(OSError):
+                materializer.place(src, dst)
+        self.assertEqual(self.read(src), "novo")
+        self.assertFalse(os.path.exists(dst))
+
+    def test_hardlink_never_overwrites(self):
+        src, dst = self.write("origem", "novo"), self.write("final", "antigo")
+        with self.assertRaises(FileExistsError):
+            omnifile.OutputMaterializer('hardlink').place(src, dst)
+        self.assertEqual(self.read(dst), "antigo")
+
+
+if __name__ == '__main__':
+    unittest.main()